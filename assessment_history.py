@@ -0,0 +1,160 @@
+import datetime
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import risk_scoring
+import task_rollup
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assessments (
+    id INTEGER PRIMARY KEY,
+    upload_key TEXT,
+    file_name TEXT,
+    created REAL NOT NULL,
+    risk_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scores (
+    assessment_id INTEGER NOT NULL REFERENCES assessments(id),
+    method TEXT NOT NULL,
+    risk_name TEXT NOT NULL,
+    task TEXT,
+    score REAL NOT NULL,
+    rank INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    method TEXT NOT NULL,
+    task TEXT,
+    UNIQUE (method, task)
+);
+CREATE INDEX IF NOT EXISTS scores_risk ON scores (risk_name, method, created);
+CREATE INDEX IF NOT EXISTS scores_task ON scores (method, task, score DESC, created);
+CREATE INDEX IF NOT EXISTS assessments_created ON assessments (created);
+"""
+
+
+def iso(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat()
+
+
+def parse_time(value):
+    # Unix seconds or an ISO 8601 date/time (UTC unless it carries an offset).
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        return parsed.timestamp()
+
+
+def quarter_start(now=None):
+    now = datetime.datetime.fromtimestamp(time.time() if now is None else now, datetime.timezone.utc)
+    return datetime.datetime(now.year, 3 * ((now.month - 1) // 3) + 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+
+
+class HistoryStore:
+    # Every assessment's ranked scores in one SQLite file, indexed by risk
+    # name, task, method and time so trend and top-N queries read only the
+    # matching rows. Each thread gets its own connection; WAL mode lets several
+    # worker processes share the file.
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def record(self, results, upload_key=None, file_name=None, created=None):
+        # Stores one assessment from a {method: (df or None, errors)} results
+        # dict; ranks follow each frame's order. Returns the assessment ID.
+        created = time.time() if created is None else created
+        risk_count = max((len(df) for df, _ in results.values() if df is not None), default=0)
+        conn = self.connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO assessments (upload_key, file_name, created, risk_count) VALUES (?, ?, ?, ?)",
+                (upload_key, file_name, created, risk_count)
+            )
+            assessment_id = cursor.lastrowid
+            for method, (df, _) in results.items():
+                if df is None or method not in risk_scoring.METHOD_SPECS:
+                    continue
+                scores = df[risk_scoring.get_score_column(method)].to_numpy(dtype="float64").tolist()
+                names = df["Risk Name"].astype(str).tolist()
+                tasks = df["Task Affected"].astype(object).where(df["Task Affected"].notna(), None).map(lambda v: v if v is None else str(v)).tolist()
+                conn.executemany("INSERT OR IGNORE INTO tasks (method, task) VALUES (?, ?)", [(method, task) for task in set(tasks)])
+                conn.executemany(
+                    "INSERT INTO scores (assessment_id, method, risk_name, task, score, rank, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    zip([assessment_id] * len(df), [method] * len(df), names, tasks, scores, np.arange(1, len(df) + 1).tolist(), [created] * len(df))
+                )
+        return assessment_id
+
+    def assessments(self, limit=50):
+        rows = self.connect().execute(
+            "SELECT id, upload_key, file_name, created, risk_count FROM assessments ORDER BY created DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [dict(row, created=iso(row["created"])) for row in rows]
+
+    def risk_trend(self, risk_name, method, limit=50):
+        # The risk's score and rank in its latest `limit` assessments, newest first.
+        rows = self.connect().execute(
+            "SELECT s.assessment_id, s.created, s.score, s.rank, s.task, a.file_name "
+            "FROM scores s JOIN assessments a ON a.id = s.assessment_id "
+            "WHERE s.risk_name = ? AND s.method = ? ORDER BY s.created DESC LIMIT ?",
+            (str(risk_name), method, limit)
+        ).fetchall()
+        return [dict(row, created=iso(row["created"])) for row in rows]
+
+    def top_by_task(self, method, since=None, until=None, n=10, task=None):
+        # Per task, the n risks with the highest score in any assessment
+        # between since and until (Unix seconds; default: this quarter so far).
+        # Each task walks the (method, task, score) index from the top and
+        # stops after n distinct risks, so the cost does not grow with the
+        # number of assessments in the window. Risks with no Task Affected are
+        # listed (and can be asked for) under task_rollup.BLANK_TASK.
+        since = quarter_start() if since is None else since
+        until = time.time() if until is None else until
+        conn = self.connect()
+        if task is None:
+            task_names = [row["task"] for row in conn.execute("SELECT task FROM tasks WHERE method = ? ORDER BY task", (method,))]
+        else:
+            task_names = [None if task == task_rollup.BLANK_TASK else task]
+        tasks = {}
+        for name in task_names:
+            cursor = conn.execute(
+                "SELECT risk_name, score, created, assessment_id FROM scores "
+                "WHERE method = ? AND task IS ? AND created >= ? AND created <= ? "
+                "ORDER BY score DESC, created DESC",
+                (method, name, since, until)
+            )
+            best = {}
+            for row in cursor:
+                if row["risk_name"] not in best:
+                    best[row["risk_name"]] = {
+                        "risk_name": row["risk_name"],
+                        "score": row["score"],
+                        "created": iso(row["created"]),
+                        "assessment_id": row["assessment_id"],
+                    }
+                    if len(best) == n:
+                        break
+            cursor.close()
+            if best:
+                tasks[task_rollup.BLANK_TASK if name is None else name] = list(best.values())
+        return tasks
@@ -0,0 +1,83 @@
+import os
+import pickle
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+RESULT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_result_id():
+    return uuid.uuid4().hex
+
+
+def is_valid_result_id(result_id):
+    return bool(RESULT_ID_PATTERN.match(result_id or ""))
+
+
+class MemoryStore:
+    # Per-process store of assessment records keyed by result ID. Only safe to
+    # use when every request for a result reaches the same process.
+    def __init__(self, max_entries=1024, max_age=24 * 3600):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.records = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, result_id, record):
+        with self.lock:
+            self.records[result_id] = (time.time(), record)
+            self.records.move_to_end(result_id)
+            while len(self.records) > self.max_entries:
+                self.records.popitem(last=False)
+
+    def get(self, result_id):
+        with self.lock:
+            item = self.records.get(result_id)
+            if item is None:
+                return None
+            created, record = item
+            if time.time() - created > self.max_age:
+                del self.records[result_id]
+                return None
+            return record
+
+
+class DiskStore:
+    # Store backed by one pickle per result ID in a directory, so several
+    # gunicorn workers (or hosts sharing the directory) see the same records.
+    def __init__(self, directory, max_age=24 * 3600):
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, result_id):
+        return os.path.join(self.directory, f"{result_id}.pkl")
+
+    def put(self, result_id, record):
+        path = self._path(result_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def get(self, result_id):
+        if not is_valid_result_id(result_id):
+            return None
+        path = self._path(result_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+
+def make_store(directory=None, max_age=24 * 3600):
+    if directory:
+        return DiskStore(directory, max_age=max_age)
+    return MemoryStore(max_age=max_age)
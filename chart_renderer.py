@@ -0,0 +1,373 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+import risk_scoring
+
+# Bump when the drawing code changes so old chart files are not reused.
+CHART_VERSION = "5"
+CHART_NAME_PATTERN = re.compile(r"^[a-z]+_[0-9a-f]{64}\.png$")
+
+# Risk names are printed on the axis up to this many rows; past
+# DENSITY_THRESHOLD the default view switches to score histograms.
+MAX_LABELED_RISKS = 100
+DENSITY_THRESHOLD = 2000
+DENSITY_BINS = 50
+DEFAULT_TOP_N = 50
+# How long ChartRenderer.wait blocks for a chart by default, in seconds.
+WAIT_SECONDS = 120
+
+METHOD_STYLES = [
+    ("fmea", "red", "FMEA (RPN)"),
+    ("risk matrix", "green", "Risk Matrix (Risk Score)"),
+    ("bow-tie", "blue", "Bow-Tie (Barrier Score)"),
+    ("environmental", "purple", "Environmental (GWP, Acidification)"),
+]
+
+
+def select_view(matrix, view="auto", top_n=DEFAULT_TOP_N, page=0, page_size=DEFAULT_TOP_N):
+    # Returns (rows to draw, resolved view, title suffix). "auto" draws every
+    # risk up to DENSITY_THRESHOLD and switches to the density view above it;
+    # "top" keeps the top_n risks by their highest normalized score and "page"
+    # shows one page_size slice in register order.
+    n = len(matrix)
+    if view == "auto":
+        view = "density" if n > DENSITY_THRESHOLD else "all"
+    if view == "top":
+        methods = [method for method, _, _ in METHOD_STYLES if method in matrix]
+        best = matrix[methods].max(axis=1).to_numpy()
+        order = np.argsort(-best, kind="stable")[:top_n]
+        return matrix.iloc[order].reset_index(drop=True), view, f" (top {len(order)} of {n} risks)"
+    if view == "page":
+        start = page * page_size
+        rows = matrix.iloc[start:start + page_size].reset_index(drop=True)
+        return rows, view, f" (risks {start + 1}-{start + len(rows)} of {n})"
+    if view == "density":
+        return matrix, view, f" ({n} risks)"
+    return matrix, "all", ""
+
+
+def draw_combined_scores(fig, matrix, title_suffix=""):
+    # matrix is the frame from risk_scoring.align_scores: Risk Name plus one
+    # normalized score column per method. Uses only the Figure API, so it is
+    # safe to call from several threads at once. Connectors are drawn as one
+    # LineCollection, so the artist count does not grow with the register.
+    # NaN scores (risks a method did not score) get no point and no connector.
+    ax = fig.add_subplot(1, 1, 1)
+    n = len(matrix)
+    y_positions = np.arange(n)
+    marker_size = 100 if n <= MAX_LABELED_RISKS else max(4, 100 * MAX_LABELED_RISKS / n)
+
+    for method, color, label in METHOD_STYLES:
+        if method in matrix:
+            ax.scatter(matrix[method], y_positions, color=color, label=label, s=marker_size)
+
+    methods = [method for method, _, _ in METHOD_STYLES if method in matrix]
+    if len(methods) >= 3 and n:
+        scores = [matrix[method].to_numpy(dtype="float64") for method in methods]
+        segments = []
+        # Each method to the next, and the last back to the first: FMEA to
+        # Risk Matrix, Risk Matrix to Bow-Tie, ... back to FMEA.
+        for start, end in zip(scores, scores[1:] + scores[:1]):
+            scored = ~(np.isnan(start) | np.isnan(end))
+            segments.append(np.stack([np.column_stack([start, y_positions]), np.column_stack([end, y_positions])], axis=1)[scored])
+        ax.add_collection(LineCollection(np.concatenate(segments), colors="gray", linestyles="--", alpha=0.5))
+
+    if n <= MAX_LABELED_RISKS:
+        ax.set_yticks(list(y_positions))
+        ax.set_yticklabels(matrix["Risk Name"].tolist())
+        ax.set_ylabel("Risk Name")
+    else:
+        ax.set_ylabel("Risk (register order)")
+    ax.set_xlabel("Normalized Score (0 to 100)")
+    ax.set_title("Comparison of Risk Scores Across Methods" + title_suffix)
+    ax.set_xlim(0, 100)
+    ax.legend()
+    ax.grid(True, which="both", linestyle="--", alpha=0.7)
+    fig.tight_layout()
+
+
+def draw_score_density(fig, matrix, title_suffix=""):
+    # Aggregated view for large registers: a histogram of normalized scores
+    # per method, whose cost depends on the number of bins, not of risks.
+    ax = fig.add_subplot(1, 1, 1)
+    edges = np.linspace(0, 100, DENSITY_BINS + 1)
+    for method, color, label in METHOD_STYLES:
+        if method in matrix:
+            values = matrix[method].to_numpy(dtype="float64")
+            values = np.clip(values[~np.isnan(values)], 0, 100)
+            counts, _ = np.histogram(values, bins=edges)
+            ax.stairs(counts, edges, color=color, label=label, linewidth=2)
+    ax.set_xlabel("Normalized Score (0 to 100)")
+    ax.set_ylabel("Number of Risks")
+    ax.set_title("Distribution of Risk Scores Across Methods" + title_suffix)
+    ax.set_xlim(0, 100)
+    ax.legend()
+    ax.grid(True, which="both", linestyle="--", alpha=0.7)
+    fig.tight_layout()
+
+
+def render_combined_png(matrix, view="auto", top_n=DEFAULT_TOP_N, page=0, page_size=DEFAULT_TOP_N):
+    rows, view, title_suffix = select_view(matrix, view, top_n, page, page_size)
+    if view == "density":
+        fig = Figure(figsize=(12, 8))
+        FigureCanvasAgg(fig)
+        draw_score_density(fig, rows, title_suffix)
+    else:
+        # Labelled views grow with their row count up to a readable limit.
+        height = 8 if len(rows) > MAX_LABELED_RISKS else min(20, max(8, 0.2 * len(rows)))
+        fig = Figure(figsize=(12, height))
+        FigureCanvasAgg(fig)
+        draw_combined_scores(fig, rows, title_suffix)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    buf.seek(0)
+    return buf
+
+
+# (x, y) input columns of each method's risk matrix chart.
+MATRIX_AXES = {
+    "fmea": ("Probability (%)", "Impact (Severity)"),
+    "risk matrix": ("Probability", "Impact"),
+    "bow-tie": ("Cause Likelihood", "Consequence Severity"),
+}
+
+
+# Heatmap axes with at most HEATMAP_LEVELS integer levels get one cell per
+# level; wider ranges (FMEA's Probability (%)) are split into that many
+# equal buckets. Each cell lists its HEATMAP_TOP_NAMES highest-scoring risks.
+HEATMAP_LEVELS = 10
+HEATMAP_TOP_NAMES = 2
+HEATMAP_NAME_LENGTH = 16
+
+
+def heatmap_edges(method, column):
+    # (bin edges, tick positions) for one input column, from its METHOD_SPECS range.
+    low, high = next((low, high) for name, low, high in risk_scoring.METHOD_SPECS[method]["inputs"] if name == column)
+    if high - low + 1 <= HEATMAP_LEVELS:
+        levels = np.arange(low, high + 1, dtype="float64")
+        return np.append(levels - 0.5, high + 0.5), levels
+    edges = np.linspace(low, high, HEATMAP_LEVELS + 1)
+    return edges, edges
+
+
+def heatmap_cells(df, method, top_names=HEATMAP_TOP_NAMES):
+    # Returns (counts[x bin, y bin], {(x bin, y bin): names, highest score
+    # first}, x edges, y edges, x ticks, y ticks). Binning and counting are
+    # vectorized; names are only read for each cell's top rows.
+    x_axis, y_axis = MATRIX_AXES[method]
+    x_edges, x_ticks = heatmap_edges(method, x_axis)
+    y_edges, y_ticks = heatmap_edges(method, y_axis)
+    nx, ny = len(x_edges) - 1, len(y_edges) - 1
+    # The last bin is closed on the right, so the top of a range is counted.
+    xi = np.clip(np.searchsorted(x_edges, df[x_axis].to_numpy(dtype="float64"), side="right") - 1, 0, nx - 1)
+    yi = np.clip(np.searchsorted(y_edges, df[y_axis].to_numpy(dtype="float64"), side="right") - 1, 0, ny - 1)
+    cells = xi * ny + yi
+    counts = np.bincount(cells, minlength=nx * ny).reshape(nx, ny)
+
+    # Highest score first within each cell; a row's place in that order minus
+    # its cell's first place is its rank within the cell.
+    scores = df[risk_scoring.get_score_column(method)].to_numpy(dtype="float64")
+    order = np.lexsort((-scores, cells))
+    starts = np.cumsum(counts.ravel()) - counts.ravel()
+    in_cell = np.arange(len(order)) - starts[cells[order]]
+    top_rows = order[in_cell < top_names]
+    names = {}
+    for cell, name in zip(cells[top_rows].tolist(), df["Risk Name"].iloc[top_rows].astype(str)):
+        names.setdefault(divmod(cell, ny), []).append(name)
+    return counts, names, x_edges, y_edges, x_ticks, y_ticks
+
+
+def draw_risk_heatmap(fig, df, method):
+    # The risk matrix binned into its native grid, with the count and top
+    # names in each cell. Cost depends on the grid size, not the row count.
+    x_axis, y_axis = MATRIX_AXES[method]
+    counts, names, x_edges, y_edges, x_ticks, y_ticks = heatmap_cells(df, method)
+    ax = fig.add_subplot(1, 1, 1)
+    mesh = ax.pcolormesh(x_edges, y_edges, counts.T, cmap="YlOrRd", edgecolors="white", linewidth=0.5)
+    fig.colorbar(mesh, ax=ax, label="Risks")
+    for (i, j), cell_names in names.items():
+        text = "\n".join([str(counts[i, j])] + [name[:HEATMAP_NAME_LENGTH] for name in cell_names])
+        ax.text(
+            (x_edges[i] + x_edges[i + 1]) / 2, (y_edges[j] + y_edges[j + 1]) / 2, text,
+            ha="center", va="center", fontsize=7, color="white" if mesh.norm(counts[i, j]) > 0.6 else "black"
+        )
+    ax.set_xticks(x_ticks)
+    ax.set_yticks(y_ticks)
+    ax.set_xlabel(x_axis)
+    ax.set_ylabel(y_axis)
+    ax.set_title(f"{method.upper()} Risk Matrix ({len(df)} risks)")
+
+
+def draw_risk_matrix(fig, df, method):
+    # The method's scored risks placed by their two main inputs, labelled up
+    # to MAX_LABELED_RISKS. Past DENSITY_THRESHOLD it is drawn as a heatmap.
+    if len(df) > DENSITY_THRESHOLD:
+        draw_risk_heatmap(fig, df, method)
+        return
+    x_axis, y_axis = MATRIX_AXES[method]
+    ax = fig.add_subplot(1, 1, 1)
+    ax.scatter(df[x_axis], df[y_axis], s=100, c="blue", alpha=0.5)
+    if len(df) <= MAX_LABELED_RISKS:
+        for name, x, y in zip(df["Risk Name"], df[x_axis], df[y_axis]):
+            ax.annotate(name, (x, y))
+    ax.set_xlabel(x_axis)
+    ax.set_ylabel(y_axis)
+    ax.set_title(f"{method.upper()} Risk Matrix")
+    ax.grid(True)
+
+
+def draw_score_bar(fig, df, method):
+    # One labelled bar per risk, highest score first; past MAX_LABELED_RISKS
+    # only the top MAX_LABELED_RISKS are drawn.
+    score_column = risk_scoring.get_score_column(method)
+    scores = df[score_column].to_numpy(dtype="float64")
+    order = np.argsort(-scores, kind="stable")[:MAX_LABELED_RISKS]
+    suffix = f" (top {len(order)} of {len(df)})" if len(df) > MAX_LABELED_RISKS else ""
+    ax = fig.add_subplot(1, 1, 1)
+    positions = np.arange(len(order))
+    ax.bar(positions, scores[order], color="orange")
+    ax.set_xlabel("Risk Name")
+    ax.set_ylabel(score_column)
+    ax.set_title(f"{score_column} of Risks (Sorted) - {method.upper()}{suffix}")
+    ax.set_xticks(positions)
+    ax.set_xticklabels(df["Risk Name"].iloc[order].astype(str), rotation=45, ha="right")
+    fig.tight_layout()
+
+
+# Per-method charts: kind -> draw function.
+METHOD_CHARTS = {
+    "matrix": draw_risk_matrix,
+    "heatmap": draw_risk_heatmap,
+    "bar": draw_score_bar,
+}
+
+
+def method_chart_frame(kind, df, method):
+    # Just the columns the chart draws, so its cache key only changes with them.
+    if kind == "matrix" and len(df) <= DENSITY_THRESHOLD:
+        return df[["Risk Name", *MATRIX_AXES[method]]]
+    if kind in ("matrix", "heatmap"):
+        return df[["Risk Name", *MATRIX_AXES[method], risk_scoring.get_score_column(method)]]
+    return df[["Risk Name", risk_scoring.get_score_column(method)]]
+
+
+def render_method_png(kind, frame, method):
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    METHOD_CHARTS[kind](fig, frame, method)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    buf.seek(0)
+    return buf
+
+
+def write_png(path, render, *args):
+    # Writes render(*args) to path through a temporary file, so a chart file
+    # is either complete or absent. Module level so a process pool can run it.
+    buf = render(*args)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buf.getvalue())
+    os.replace(tmp_path, path)
+
+
+def chart_key(kind, matrix, options=()):
+    digest = hashlib.sha256()
+    digest.update(f"{kind}:{CHART_VERSION}:{options!r}:".encode("utf-8"))
+    digest.update(",".join(map(str, matrix.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(matrix, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ChartRenderer:
+    # Renders charts on a thread pool (or a process pool, with processes=True,
+    # started with mp_context) into chart_folder under content-hashed names.
+    # A chart whose file already exists is never drawn again, and a request
+    # for one still being drawn waits for that render instead of starting
+    # another.
+    def __init__(self, chart_folder, max_workers=2, processes=False, mp_context=None):
+        self.chart_folder = chart_folder
+        self.max_workers = max_workers
+        self.processes = processes
+        self.mp_context = mp_context
+        self.executor = None
+        self.pending = {}
+        self.lock = threading.Lock()
+        os.makedirs(chart_folder, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.chart_folder, name)
+
+    def submit_combined(self, matrix, view="auto", top_n=DEFAULT_TOP_N, page=0, page_size=DEFAULT_TOP_N):
+        # Returns the chart file name straight away; the PNG is written in the
+        # background unless it already exists.
+        options = (view, top_n, page, page_size)
+        name = f"combined_{chart_key('combined', matrix, options)}.png"
+        return self.submit(name, render_combined_png, matrix, *options)
+
+    def render_combined(self, matrix, view="auto", top_n=DEFAULT_TOP_N, page=0, page_size=DEFAULT_TOP_N):
+        # As submit_combined, but draws in the calling thread and returns once
+        # the file is written. For job workers, which return their result only
+        # once its chart can be served.
+        options = (view, top_n, page, page_size)
+        name = f"combined_{chart_key('combined', matrix, options)}.png"
+        if not os.path.exists(self.path(name)):
+            write_png(self.path(name), render_combined_png, matrix, *options)
+        return name
+
+    def submit_method(self, kind, df, method):
+        # As submit_combined, for one of a method's METHOD_CHARTS.
+        frame = method_chart_frame(kind, df, method)
+        name = f"{kind}_{chart_key(kind, frame, (method,))}.png"
+        return self.submit(name, render_method_png, kind, frame, method)
+
+    def submit(self, name, render, *args):
+        with self.lock:
+            if name in self.pending or os.path.exists(self.path(name)):
+                return name
+            if self.executor is None:
+                if self.processes:
+                    self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.mp_context)
+                else:
+                    self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            future = self.executor.submit(write_png, self.path(name), render, *args)
+            self.pending[name] = future
+        # Outside the lock: the callback runs at once if the render is done.
+        future.add_done_callback(lambda done: self.finished(name, done))
+        return name
+
+    def finished(self, name, future):
+        with self.lock:
+            if self.pending.get(name) is future:
+                del self.pending[name]
+
+    def cancel(self, names):
+        # Drops the renders of names that have not started; started ones finish.
+        with self.lock:
+            futures = [self.pending.get(name) for name in names]
+        for future in futures:
+            if future is not None:
+                future.cancel()
+
+    def wait(self, name, timeout=WAIT_SECONDS):
+        # Blocks until a submitted chart is on disk, for at most timeout
+        # seconds (None waits as long as it takes). True if the file exists;
+        # False if it does not, its render failed or it is still drawing.
+        with self.lock:
+            future = self.pending.get(name)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                return False
+        return os.path.exists(self.path(name))
@@ -1,99 +1,430 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import brightway2 as bw
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from scipy import sparse
+from scipy.sparse.linalg import splu
+from bw2calc.matrices import MatrixBuilder
+from stats_arrays import MCRandomNumberGenerator
 
-bw.projects.set_current("EnvironmentalRiskProject")
-bw.bw2setup()
+PROJECT_NAME = "EnvironmentalRiskProject"
+DATABASE_NAME = "simple_db"
 
-db = bw.Database("simple_db")
-db.write({
-    ("simple_db", "ChemicalSpill"): {
+DATABASE = {
+    (DATABASE_NAME, "ChemicalSpill"): {
         "name": "Chemical Spill Impact",
         "unit": "unit",
         "exchanges": [
-            {"input": ("simple_db", "CO2"), "amount": 100, "type": "biosphere"},
-            {"input": ("simple_db", "SO2"), "amount": 20, "type": "biosphere"},
+            {"input": (DATABASE_NAME, "CO2"), "amount": 100, "type": "biosphere"},
+            {"input": (DATABASE_NAME, "SO2"), "amount": 20, "type": "biosphere"},
         ],
     },
-    ("simple_db", "WaterContamination"): {
+    (DATABASE_NAME, "WaterContamination"): {
         "name": "Water Contamination Impact",
         "unit": "unit",
         "exchanges": [
-            {"input": ("simple_db", "Pollutant"), "amount": 50, "type": "biosphere"},
-            {"input": ("simple_db", "SO2"), "amount": 10, "type": "biosphere"},
+            {"input": (DATABASE_NAME, "Pollutant"), "amount": 50, "type": "biosphere"},
+            {"input": (DATABASE_NAME, "SO2"), "amount": 10, "type": "biosphere"},
         ],
     },
-    ("simple_db", "EcosystemDamage"): {
+    (DATABASE_NAME, "EcosystemDamage"): {
         "name": "Ecosystem Damage Impact",
         "unit": "unit",
         "exchanges": [
-            {"input": ("simple_db", "CO2"), "amount": 30, "type": "biosphere"},
-            {"input": ("simple_db", "SO2"), "amount": 5, "type": "biosphere"},
+            {"input": (DATABASE_NAME, "CO2"), "amount": 30, "type": "biosphere"},
+            {"input": (DATABASE_NAME, "SO2"), "amount": 5, "type": "biosphere"},
         ],
     },
-    ("simple_db", "CO2"): {
+    (DATABASE_NAME, "CO2"): {
         "name": "CO2 Emission",
         "type": "biosphere",
         "unit": "kg",
     },
-    ("simple_db", "Pollutant"): {
+    (DATABASE_NAME, "Pollutant"): {
         "name": "Water Pollutant",
         "type": "biosphere",
         "unit": "kg",
     },
-    ("simple_db", "SO2"): {
+    (DATABASE_NAME, "SO2"): {
         "name": "SO2 Emission",
         "type": "biosphere",
         "unit": "kg",
     },
-})
+}
 
 gwp_method = ("IPCC", "climate change", "GWP 100a")
 acid_method = ("CML", "acidification", "generic")
 
-bw.Method(gwp_method).write([
-    (db.get("CO2").key, {"amount": 1}),
-    (db.get("Pollutant").key, {"amount": 2}),
-    (db.get("SO2").key, {"amount": 0}),
-])
-
-bw.Method(acid_method).write([
-    (db.get("CO2").key, {"amount": 0}),
-    (db.get("Pollutant").key, {"amount": 0.5}),
-    (db.get("SO2").key, {"amount": 1.5}),
-])
-
-results_gwp = []
-results_acid = []
-processes = [db.get("ChemicalSpill"), db.get("WaterContamination"), db.get("EcosystemDamage")]
-
-for process in processes:
-    lca = bw.LCA({process: 1}, gwp_method)
-    lca.lci()
-    lca.lcia()
-    results_gwp.append({"Risk Name": process["name"].replace(" Impact", ""), "GWP (kg CO2 eq)": lca.score})
-
-    lca.switch_method(acid_method)
-    lca.lcia()
-    results_acid.append({"Risk Name": process["name"].replace(" Impact", ""), "Acidification (kg SO2 eq)": lca.score})
-
-df_gwp = pd.DataFrame(results_gwp)
-df_acid = pd.DataFrame(results_acid)
-df = df_gwp.merge(df_acid, on="Risk Name")
-
-print("Environmental Impact Results:")
-print(df.to_string(index=False))
-
-plt.figure(figsize=(10, 6))
-plt.bar(df["Risk Name"], df["GWP (kg CO2 eq)"], color="blue", label="GWP (kg CO2 eq)")
-plt.bar(df["Risk Name"], df["Acidification (kg SO2 eq)"], color="red", alpha=0.5, label="Acidification (kg SO2 eq)")
-plt.xlabel("Risk Name")
-plt.ylabel("Impact")
-plt.title("Environmental Impacts (GWP and Acidification)")
-plt.legend()
-plt.xticks(rotation=45, ha="right")
-plt.tight_layout()
-plt.savefig("environmental_impact_bar.png")
-plt.close()
-
-print("Chart saved as 'environmental_impact_bar.png'")
\ No newline at end of file
+# Characterization factors per method, by flow code in DATABASE_NAME.
+METHOD_FACTORS = {
+    gwp_method: {"CO2": 1, "Pollutant": 2, "SO2": 0},
+    acid_method: {"CO2": 0, "Pollutant": 0.5, "SO2": 1.5},
+}
+IMPACT_COLUMNS = {
+    gwp_method: "GWP (kg CO2 eq)",
+    acid_method: "Acidification (kg SO2 eq)",
+}
+RISK_PROCESSES = ["ChemicalSpill", "WaterContamination", "EcosystemDamage"]
+
+MC_ITERATIONS = 1000
+MC_SEED = 0
+# Iterations per task sent to a worker; each chunk draws from its own stream.
+MC_CHUNK_SIZE = 50
+MC_PERCENTILES = (5, 50, 95)
+# Bins per process and method in the histogram behind the running percentiles.
+MC_HISTOGRAM_BINS = 1024
+# Iterative refinement steps on the deterministic LU before a sampled
+# technosphere matrix is factorized on its own.
+MC_MAX_REFINEMENTS = 20
+MC_TOLERANCE = 1e-10
+
+
+def fingerprint(data):
+    # Stable hash of a database or method definition; tuple keys are
+    # turned into sorted [key, value] pairs so the JSON is canonical.
+    if isinstance(data, dict):
+        data = sorted([list(key) if isinstance(key, tuple) else key, value] for key, value in data.items())
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def is_current(metadata, name, digest, processed_path):
+    # True when name was written from a definition with this fingerprint and
+    # its processed array is still on disk.
+    return name in metadata and metadata[name].get("fingerprint") == digest and os.path.exists(processed_path)
+
+
+def setup_project(force=False):
+    # Idempotent: the database and each method are only rewritten (and
+    # reprocessed) when their definition differs from the fingerprint stored
+    # with them, or when force is set. Returns the database and the names of
+    # the pieces that were rebuilt.
+    bw.projects.set_current(PROJECT_NAME)
+    if "biosphere3" not in bw.databases:
+        bw.bw2setup()
+
+    rebuilt = []
+    db = bw.Database(DATABASE_NAME)
+    digest = fingerprint(DATABASE)
+    if force or not is_current(bw.databases, DATABASE_NAME, digest, db.filepath_processed()):
+        db.write(DATABASE)
+        bw.databases[DATABASE_NAME]["fingerprint"] = digest
+        bw.databases.flush()
+        rebuilt.append(DATABASE_NAME)
+
+    for method, factors in METHOD_FACTORS.items():
+        lcia_method = bw.Method(method)
+        digest = fingerprint(factors)
+        if not force and is_current(bw.methods, method, digest, lcia_method.filepath_processed()):
+            continue
+        lcia_method.register()
+        lcia_method.write([((DATABASE_NAME, code), {"amount": amount}) for code, amount in factors.items()])
+        bw.methods[method]["fingerprint"] = digest
+        bw.methods.flush()
+        rebuilt.append(" / ".join(method))
+    return db, rebuilt
+
+
+def impact_column(method):
+    return IMPACT_COLUMNS.get(method, " / ".join(method))
+
+
+class BatchLCA:
+    # Impact scores of many demand vectors under several LCIA methods from a
+    # single matrix build and a single LU factorization of the technosphere
+    # matrix A. A score is c B A^-1 f for characterization row c, biosphere
+    # matrix B and demand f, so solving A^T y = (c B)^T once per method gives
+    # every product's score per unit demanded; all demands are then scored
+    # in one multiply, however many there are.
+    def __init__(self, activities, methods):
+        # activities: keys or activities spanning the databases to load.
+        self.methods = list(methods)
+        lca = bw.LCA({key_of(activity): 1 for activity in activities}, self.methods[0])
+        lca.load_lci_data()
+        self.product_dict = lca.product_dict
+        self.technosphere_matrix = lca.technosphere_matrix.tocsc()
+        self.biosphere_matrix = lca.biosphere_matrix.tocsr()
+
+        # Stacked characterization: one row per method, one column per flow.
+        rows = []
+        for method in self.methods:
+            lca.switch_method(method)
+            rows.append(lca.characterization_matrix.diagonal())
+        self.characterization = sparse.csr_matrix(np.vstack(rows))
+
+        self.lu = splu(self.technosphere_matrix)
+        characterized = (self.characterization @ self.biosphere_matrix).T.toarray()
+        # Products x methods.
+        self.unit_scores = self.lu.solve(np.ascontiguousarray(characterized), trans="T")
+
+    def demand_matrix(self, demands):
+        # Products x demands, one column per {key or activity: amount} dict.
+        rows, cols, amounts = [], [], []
+        for col, demand in enumerate(demands):
+            for activity, amount in demand.items():
+                key = key_of(activity)
+                if key not in self.product_dict:
+                    raise KeyError(f"{key} is not in the technosphere of this LCA")
+                rows.append(self.product_dict[key])
+                cols.append(col)
+                amounts.append(amount)
+        return sparse.csc_matrix((amounts, (rows, cols)), shape=(len(self.product_dict), len(demands)))
+
+    def scores(self, demands):
+        # Methods x demands array of LCIA scores.
+        return (self.demand_matrix(demands).T @ self.unit_scores).T
+
+
+def key_of(activity):
+    return activity.key if hasattr(activity, "key") else tuple(activity)
+
+
+def impact_frame(processes, methods=(gwp_method, acid_method), engine=None):
+    # One row per process with a column per method, for unit demand of each.
+    engine = BatchLCA(processes, methods) if engine is None else engine
+    scores = engine.scores([{process: 1} for process in processes])
+    df = pd.DataFrame({"Risk Name": [process["name"].replace(" Impact", "") for process in processes]})
+    for method, row in zip(engine.methods, scores):
+        df[impact_column(method)] = row
+    return df
+
+
+class MonteCarloLCA:
+    # Sampled scores of a fixed set of processes under several methods. The
+    # matrices are built once and only their values are redrawn; each sample
+    # is solved on the adjoint side like BatchLCA, by iterative refinement
+    # with the LU factors of the deterministic technosphere matrix, which
+    # converges in a few steps for the usual spread of exchange amounts.
+    def __init__(self, processes, methods):
+        self.methods = list(methods)
+        self.keys = [key_of(process) for process in processes]
+        self.lca = bw.LCA({key: 1 for key in self.keys}, self.methods[0])
+        self.lca.load_lci_data()
+        self.cf_params = []
+        for method in self.methods:
+            self.lca.switch_method(method)
+            self.cf_params.append(self.lca.cf_params.copy())
+        self.lu = splu(self.lca.technosphere_matrix.tocsc())
+        self.products = np.array([self.lca.product_dict[key] for key in self.keys])
+
+    def solve_transposed(self, matrix, rhs):
+        # A^T x = rhs for a sampled A, starting from the deterministic factors.
+        x = self.lu.solve(rhs, trans="T")
+        limit = MC_TOLERANCE * max(np.abs(rhs).max(), 1e-300)
+        for _ in range(MC_MAX_REFINEMENTS):
+            residual = rhs - matrix.T @ x
+            if np.abs(residual).max() <= limit:
+                return x
+            x += self.lu.solve(residual, trans="T")
+        return splu(matrix.tocsc()).solve(rhs, trans="T")
+
+    def sample(self, seed_sequence, iterations):
+        # (iterations, methods, processes) array of sampled scores.
+        seeds = [int(s.generate_state(1)[0]) for s in seed_sequence.spawn(2 + len(self.methods))]
+        tech = MCRandomNumberGenerator(self.lca.tech_params, seed=seeds[0])
+        bio = MCRandomNumberGenerator(self.lca.bio_params, seed=seeds[1])
+        cfs = [MCRandomNumberGenerator(params, seed=seed) for params, seed in zip(self.cf_params, seeds[2:])]
+        scores = np.empty((iterations, len(self.methods), len(self.keys)))
+        for i in range(iterations):
+            self.lca.rebuild_technosphere_matrix(tech.next())
+            self.lca.rebuild_biosphere_matrix(bio.next())
+            characterization = sparse.csr_matrix(np.vstack([
+                MatrixBuilder.build_diagonal_matrix(params, self.lca._biosphere_dict, "row", "row", new_data=rng.next()).diagonal()
+                for params, rng in zip(self.cf_params, cfs)
+            ]))
+            rhs = np.ascontiguousarray((characterization @ self.lca.biosphere_matrix).T.toarray())
+            unit_scores = self.solve_transposed(self.lca.technosphere_matrix, rhs)
+            scores[i] = unit_scores[self.products].T
+        return scores
+
+
+worker_engine = None
+
+
+def init_monte_carlo_worker(project, keys, methods):
+    # Each pool worker builds its matrices and factors once.
+    global worker_engine
+    bw.projects.set_current(project)
+    worker_engine = MonteCarloLCA(keys, methods)
+
+
+def monte_carlo_chunk(seed_sequence, iterations):
+    return worker_engine.sample(seed_sequence, iterations)
+
+
+def summarize_samples(samples, names, methods):
+    # One row per process: mean and percentiles of each method's samples.
+    df = pd.DataFrame({"Risk Name": names})
+    percentiles = np.percentile(samples, MC_PERCENTILES, axis=0)
+    for j, method in enumerate(methods):
+        column = impact_column(method)
+        df[f"{column} Mean"] = samples[:, j].mean(axis=0)
+        for p, values in zip(MC_PERCENTILES, percentiles[:, j]):
+            df[f"{column} P{p}"] = values
+    df["Iterations"] = len(samples)
+    return df
+
+
+class PercentileHistogram:
+    # Running percentiles of (methods x processes) sample streams without
+    # keeping the samples: a fixed number of equal-width bins per stream whose
+    # range doubles when a value falls outside it. Doubling merges bins in
+    # pairs, so counts stay exact and adding a chunk costs the same however
+    # many came before; a percentile is read to within one bin's width.
+    def __init__(self, shape, bins=MC_HISTOGRAM_BINS):
+        self.bins = bins
+        self.iterations = 0
+        self.counts = np.zeros(shape + (bins,), dtype=np.int64)
+        self.low = np.zeros(shape)
+        self.width = np.zeros(shape)
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+
+    def add(self, samples):
+        # samples: (iterations, methods, processes), one chunk.
+        if not self.iterations:
+            self.low = samples.min(axis=0)
+            span = samples.max(axis=0) - self.low
+            self.width = np.maximum(span, np.abs(self.low) * 1e-12 + 1e-300) / self.bins * (1 + 1e-9)
+        self.minimum = np.minimum(self.minimum, samples.min(axis=0))
+        self.maximum = np.maximum(self.maximum, samples.max(axis=0))
+        for cell in np.ndindex(self.low.shape):
+            self.fit(cell)
+            index = ((samples[(slice(None),) + cell] - self.low[cell]) // self.width[cell]).astype(np.int64)
+            self.counts[cell] += np.bincount(np.clip(index, 0, self.bins - 1), minlength=self.bins)
+        self.iterations += len(samples)
+
+    def fit(self, cell):
+        # Doubles the cell's bin width until its range covers minimum..maximum.
+        counts = self.counts[cell]
+        while self.low[cell] + self.width[cell] * self.bins <= self.maximum[cell]:
+            merged = counts.reshape(-1, 2).sum(axis=1)
+            counts[:] = 0
+            counts[:len(merged)] = merged
+            self.width[cell] *= 2
+        while self.minimum[cell] < self.low[cell]:
+            merged = counts.reshape(-1, 2).sum(axis=1)
+            counts[:] = 0
+            counts[len(merged):] = merged
+            self.low[cell] -= self.width[cell] * self.bins
+            self.width[cell] *= 2
+
+    def percentiles(self, percentiles):
+        # (percentiles, methods, processes) array, interpolated within bins.
+        cumulative = self.counts.cumsum(axis=-1)
+        total = cumulative[..., -1:]
+        result = np.empty((len(percentiles),) + self.low.shape)
+        for k, p in enumerate(percentiles):
+            rank = p / 100 * total
+            index = np.minimum((cumulative < rank).sum(axis=-1, keepdims=True), self.bins - 1)
+            before = np.take_along_axis(cumulative, index, axis=-1) - np.take_along_axis(self.counts, index, axis=-1)
+            inside = np.take_along_axis(self.counts, index, axis=-1)
+            fraction = np.divide(rank - before, inside, out=np.zeros(inside.shape), where=inside > 0)
+            value = self.low + (index[..., 0] + fraction[..., 0]) * self.width
+            result[k] = np.clip(value, self.minimum, self.maximum)
+        return result
+
+
+def summarize_running(totals, histogram, iterations, names, methods):
+    # The running view while chunks come in: each method's mean so far, from
+    # the per-process sums in totals (methods x processes), and percentiles
+    # read from histogram, in the columns of summarize_samples.
+    df = pd.DataFrame({"Risk Name": names})
+    percentiles = histogram.percentiles(MC_PERCENTILES)
+    for j, method in enumerate(methods):
+        column = impact_column(method)
+        df[f"{column} Mean"] = totals[j] / iterations
+        for p, values in zip(MC_PERCENTILES, percentiles[:, j]):
+            df[f"{column} P{p}"] = values
+    df["Iterations"] = iterations
+    return df
+
+
+def iter_monte_carlo(processes, methods=(gwp_method, acid_method), iterations=MC_ITERATIONS, seed=MC_SEED, workers=None, chunk_size=MC_CHUNK_SIZE):
+    # Runs the iterations in chunks across a process pool. Each time a chunk
+    # finishes before the last it yields the running summary
+    # (summarize_running): means kept as sums and percentiles from a
+    # PercentileHistogram, so a chunk costs the same however many came
+    # before. The final summary (summarize_samples) has exact percentiles.
+    # Chunk i always draws from child i of SeedSequence(seed), so the final
+    # summary depends on the seed only, not on the number of workers or the
+    # order chunks finish in.
+    methods = list(methods)
+    keys = [key_of(process) for process in processes]
+    names = [process["name"].replace(" Impact", "") for process in processes]
+    sizes = [min(chunk_size, iterations - start) for start in range(0, iterations, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    parts = [None] * len(sizes)
+    totals = np.zeros((len(methods), len(processes)))
+    histogram = PercentileHistogram((len(methods), len(processes)))
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_monte_carlo_worker, initargs=(bw.projects.current, keys, methods)) as pool:
+        futures = {pool.submit(monte_carlo_chunk, seeds[i], size): i for i, size in enumerate(sizes)}
+        for future in as_completed(futures):
+            part = future.result()
+            parts[futures[future]] = part
+            totals += part.sum(axis=0)
+            done += len(part)
+            if done < iterations:
+                histogram.add(part)
+                yield summarize_running(totals, histogram, done, names, methods)
+    yield summarize_samples(np.concatenate(parts), names, methods)
+
+
+def plot_impacts(df, path="environmental_impact_bar.png"):
+    plt.figure(figsize=(10, 6))
+    plt.bar(df["Risk Name"], df["GWP (kg CO2 eq)"], color="blue", label="GWP (kg CO2 eq)")
+    plt.bar(df["Risk Name"], df["Acidification (kg SO2 eq)"], color="red", alpha=0.5, label="Acidification (kg SO2 eq)")
+    plt.xlabel("Risk Name")
+    plt.ylabel("Impact")
+    plt.title("Environmental Impacts (GWP and Acidification)")
+    plt.legend()
+    plt.xticks(rotation=45, ha="right")
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Environmental impact (GWP and acidification) of the risk processes.")
+    parser.add_argument("--uncertainty", type=int, metavar="N", default=0, help="Run N Monte Carlo iterations and report percentiles")
+    parser.add_argument("--seed", type=int, default=MC_SEED, help="Seed for the Monte Carlo draws")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for Monte Carlo (default: one per core)")
+    parser.add_argument("--chunk-size", type=int, default=MC_CHUNK_SIZE, help="Monte Carlo iterations per worker task")
+    args = parser.parse_args()
+
+    db, rebuilt = setup_project()
+    if rebuilt:
+        print(f"Rebuilt: {', '.join(rebuilt)}")
+    processes = [db.get(code) for code in RISK_PROCESSES]
+    df = impact_frame(processes)
+
+    print("Environmental Impact Results:")
+    print(df.to_string(index=False))
+
+    plot_impacts(df)
+    print("Chart saved as 'environmental_impact_bar.png'")
+
+    if args.uncertainty > 0:
+        summary = None
+        reported = 0
+        for summary in iter_monte_carlo(processes, iterations=args.uncertainty, seed=args.seed, workers=args.workers, chunk_size=args.chunk_size):
+            done = int(summary["Iterations"].iat[0])
+            # A progress line roughly every tenth of the run.
+            if done == args.uncertainty or done - reported >= args.uncertainty / 10:
+                reported = done
+                means = ", ".join(f"{name} {value:.4g}" for name, value in zip(summary["Risk Name"], summary[f"{impact_column(gwp_method)} Mean"]))
+                print(f"{done}/{args.uncertainty} iterations - GWP mean: {means}")
+        print("\nMonte Carlo Results:")
+        print(summary.drop(columns="Iterations").to_string(index=False))
+        summary.to_csv("environmental_impact_uncertainty.csv", index=False)
+        print("Percentiles saved to 'environmental_impact_uncertainty.csv'")
+
+
+if __name__ == "__main__":
+    main()
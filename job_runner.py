@@ -0,0 +1,109 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import assessment_store
+
+# Workers start from a clean process rather than a fork of the web process,
+# whose threads (chart rendering, history writes, the LCA loader) may hold
+# locks at the moment of the fork that no thread in the child would release.
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+class SharedDictStore:
+    # Job status store over a multiprocessing.Manager dict, so pool workers
+    # can report progress to the web process without a shared directory.
+    def __init__(self, shared):
+        self.shared = shared
+
+    def put(self, key, record):
+        self.shared[key] = record
+
+    def get(self, key):
+        return self.shared.get(key)
+
+
+class ProgressReporter:
+    # Picklable handle passed to job functions: report(stage, progress) updates
+    # the job's status record from inside the worker process.
+    def __init__(self, statuses, job_id):
+        self.statuses = statuses
+        self.job_id = job_id
+
+    def __call__(self, stage, progress):
+        self.statuses.put(self.job_id, {
+            "state": "running",
+            "stage": stage,
+            "progress": round(float(progress), 3),
+            "updated": time.time(),
+        })
+
+
+class JobRunner:
+    # Runs long assessments in a ProcessPoolExecutor. The pool, and the
+    # Manager used for status records when no status_dir is given, start on
+    # the first submit so importing the app (or forking gunicorn workers)
+    # does not spawn processes.
+    def __init__(self, max_workers=2, status_dir=None):
+        self.max_workers = max_workers
+        self.status_dir = status_dir
+        self.executor = None
+        self.manager = None
+        self.statuses = None
+        self.lock = threading.Lock()
+
+    def _start(self):
+        with self.lock:
+            if self.executor is not None:
+                return
+            context = multiprocessing.get_context(START_METHOD)
+            if self.status_dir:
+                self.statuses = assessment_store.DiskStore(self.status_dir)
+            else:
+                self.manager = context.Manager()
+                self.statuses = SharedDictStore(self.manager.dict())
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+    def submit(self, fn, args, on_result, after=None):
+        # Calls fn(*args, progress) in a worker; on_result(job_id, future) runs
+        # in this process once it finishes and must set the final status. With
+        # after, a future, the job stays queued until it finishes, without
+        # blocking the caller, and fn gets its result before progress.
+        self._start()
+        job_id = assessment_store.new_result_id()
+        self.set_status(job_id, "queued", stage="queued", progress=0.0)
+
+        def start(ready=None):
+            try:
+                extra = () if ready is None else (ready.result(),)
+                future = self.executor.submit(fn, *args, *extra, ProgressReporter(self.statuses, job_id))
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(lambda f: on_result(job_id, f))
+
+        if after is None:
+            start()
+        else:
+            after.add_done_callback(start)
+        return job_id
+
+    def set_status(self, job_id, state, **fields):
+        record = {"state": state, "updated": time.time()}
+        record.update(fields)
+        self.statuses.put(job_id, record)
+
+    def status(self, job_id):
+        if self.statuses is None and self.status_dir:
+            # Another worker may have started the job; the directory is shared.
+            self.statuses = assessment_store.DiskStore(self.status_dir)
+        if self.statuses is None or not assessment_store.is_valid_result_id(job_id):
+            return None
+        return self.statuses.get(job_id)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.manager is not None:
+            self.manager.shutdown()
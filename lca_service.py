@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+import risk_scoring
+
+METHOD = risk_scoring.ENVIRONMENTAL
+# Optional register columns: the LCA process a risk maps to (code or name;
+# the Risk Name is tried when absent or blank) and the amount of it (default 1).
+PROCESS_COLUMN = "LCA Process"
+AMOUNT_COLUMN = "LCA Amount"
+
+
+def lookup_label(value):
+    return str(value).strip().lower()
+
+
+class LCAService:
+    # The environmental_impact model kept warm: the project is set up, the
+    # matrices built and factorized and every process's per-unit GWP and
+    # acidification computed once, when the service is loaded. Scoring a
+    # register is then a table lookup, with no Brightway call per request.
+    # Only those tables are pickled, so the service can be handed to job
+    # workers; the engine stays in the process that loaded it.
+    def __init__(self):
+        import environmental_impact
+
+        db, _ = environmental_impact.setup_project()
+        processes = [activity for activity in db if activity.get("type") != "biosphere"]
+        self.engine = environmental_impact.BatchLCA(processes, list(environmental_impact.METHOD_FACTORS))
+        self.columns = [environmental_impact.impact_column(method) for method in self.engine.methods]
+        # Per-unit impacts, one row per process, one column per LCIA method.
+        self.unit_scores = self.engine.scores([{activity: 1} for activity in processes]).T
+        self.rows = {}
+        for row, activity in enumerate(processes):
+            for label in (activity["code"], activity["name"], activity["name"].replace(" Impact", "")):
+                self.rows.setdefault(lookup_label(label), row)
+        # Normalization reference: the largest per-unit impact of any process
+        # in the model, per method.
+        self.reference = np.abs(self.unit_scores).max(axis=0)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("engine", None)
+        return state
+
+    def normalize_impacts(self, impacts):
+        # 0 to 100 per method against the model's reference impact (capped at
+        # 100 for amounts above one unit), averaged over the methods.
+        reference = np.where(self.reference > 0, self.reference, 1.0)
+        return np.clip(100 * impacts / reference, 0, 100).mean(axis=1)
+
+    def score(self, df):
+        # {method: (df or None, errors)}-style entry for the register df: one
+        # row per risk that maps to an LCA process, sorted by Environmental
+        # Score. Risks that name no process are left out silently; an unknown
+        # LCA Process or a bad LCA Amount is reported.
+        label = risk_scoring.METHOD_SPECS[METHOD]["label"]
+        row_labels = df.index.to_numpy()
+        names = df["Risk Name"]
+        explicit = np.zeros(len(df), dtype=bool)
+        if PROCESS_COLUMN in df.columns:
+            explicit = (df[PROCESS_COLUMN].notna() & (df[PROCESS_COLUMN].astype(str).str.strip() != "")).to_numpy()
+            names = df[PROCESS_COLUMN].where(explicit, df["Risk Name"])
+        positions = names.map(lambda value: self.rows.get(lookup_label(value), -1)).to_numpy(dtype=np.int64)
+
+        errors = {}
+        for pos in np.flatnonzero(explicit & (positions < 0)):
+            errors[pos] = f"Row {row_labels[pos] + 2}: Unknown LCA process '{df[PROCESS_COLUMN].iat[pos]}' ({label})"
+        amounts = np.ones(len(df))
+        if AMOUNT_COLUMN in df.columns:
+            values, failures = risk_scoring.coerce_column(df[AMOUNT_COLUMN])
+            for pos, message in failures.items():
+                errors.setdefault(pos, f"Row {row_labels[pos] + 2}: Invalid data - {message} ({METHOD.upper()})")
+            for pos in np.flatnonzero(values < 0):
+                errors.setdefault(pos, f"Row {row_labels[pos] + 2}: {AMOUNT_COLUMN} must be at least 0, got {float(values[pos])} ({label})")
+            amounts = np.where(np.isnan(values), 1.0, values)
+
+        valid = positions >= 0
+        valid[list(errors)] = False
+        messages = [errors[pos] for pos in sorted(errors)]
+        if not valid.any():
+            return None, messages
+
+        impacts = self.unit_scores[positions[valid]] * amounts[valid][:, None]
+        result = pd.DataFrame({
+            "Risk Name": df["Risk Name"].to_numpy()[valid],
+            "Task Affected": df["Task Affected"].to_numpy()[valid],
+        }, index=df.index[valid])
+        for col, values in zip(self.columns, impacts.T):
+            result[col] = values
+        score_column = risk_scoring.get_score_column(METHOD)
+        result[score_column] = self.normalize_impacts(impacts)
+        return result.sort_values(by=score_column, ascending=False, kind="stable"), messages
+
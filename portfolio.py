@@ -0,0 +1,136 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import risk_scoring
+import risk_streaming
+
+DEFAULT_TOP_K = 100
+
+
+def find_registers(patterns):
+    # Each pattern is a directory (all .xlsx files in it) or a glob.
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "*.xlsx"))
+        else:
+            matches = glob.glob(pattern)
+        paths.extend(path for path in matches if path.lower().endswith(".xlsx") and not os.path.basename(path).startswith("~$"))
+    return sorted(dict.fromkeys(paths))
+
+
+def score_register(path, top_k, chunk_size):
+    # Runs in a pool worker: streams one register and returns only its top-K
+    # per method (with provenance columns) plus counts and capped errors.
+    try:
+        streamed = risk_streaming.stream_assessment(path, chunk_size=chunk_size, top_k=top_k)
+    except Exception as e:
+        return {"path": path, "error": str(e)}
+    top = {}
+    for method in streamed.methods:
+        df = streamed.top[method]
+        if df is not None:
+            df = df.copy()
+            df.insert(0, "Source Row", df.index + 2)
+            df.insert(0, "Source File", os.path.basename(path))
+        top[method] = df
+    return {
+        "path": path,
+        "rows": streamed.rows,
+        "valid_counts": streamed.valid_counts,
+        "error_counts": streamed.error_counts,
+        "errors": streamed.errors,
+        "top": top,
+    }
+
+
+def merge_top(current, incoming, method, top_k):
+    # Keeps the global top-K for one method. Ties are broken by file and row
+    # so the ranking does not depend on which worker finished first.
+    if incoming is None:
+        return current
+    candidates = incoming if current is None else pd.concat([current, incoming], ignore_index=True)
+    score_column = risk_scoring.get_score_column(method)
+    candidates = candidates.sort_values(by=[score_column, "Source File", "Source Row"], ascending=[False, True, True], kind="stable")
+    return candidates.head(top_k).reset_index(drop=True)
+
+
+def score_portfolio(paths, top_k=DEFAULT_TOP_K, workers=None, chunk_size=risk_streaming.DEFAULT_CHUNK_SIZE, on_result=None):
+    # Scores every register across a process pool and folds each file's top-K
+    # into the global top-K per method as results arrive, so no more than
+    # top_k rows per method are kept from any one file.
+    merged = risk_streaming.StreamedAssessment(risk_scoring.METHODS, top_k)
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(score_register, path, top_k, chunk_size) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            if "error" not in result:
+                name = os.path.basename(result["path"])
+                merged.rows += result["rows"]
+                for method in merged.methods:
+                    merged.top[method] = merge_top(merged.top[method], result["top"][method], method, top_k)
+                    merged.valid_counts[method] += result["valid_counts"][method]
+                    merged.error_counts[method] += result["error_counts"][method]
+                    room = risk_streaming.MAX_ERROR_MESSAGES - len(merged.errors[method])
+                    merged.errors[method].extend(f"[{name}] {error}" for error in result["errors"][method][:max(room, 0)])
+            summaries.append(result)
+            if on_result is not None:
+                on_result(result)
+    return merged, summaries
+
+
+def ranking_frame(merged, method):
+    df = merged.top[method]
+    if df is None:
+        return None
+    columns = ["Source File", "Source Row"] + risk_scoring.get_result_columns(method)
+    ranking = df[columns].copy()
+    ranking.insert(0, "Rank", range(1, len(ranking) + 1))
+    return ranking
+
+
+def print_result(result):
+    name = os.path.basename(result["path"])
+    if "error" in result:
+        print(f"{name}: failed - {result['error']}")
+        return
+    counts = ", ".join(f"{m.upper()} {result['valid_counts'][m]} valid / {result['error_counts'][m]} errors" for m in risk_scoring.METHODS)
+    print(f"{name}: {result['rows']} rows ({counts})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a portfolio of risk registers and merge their rankings.")
+    parser.add_argument("inputs", nargs="+", help="Directories of .xlsx registers or glob patterns (e.g. 'uploads/*.xlsx')")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="Risks kept in each merged ranking")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--chunk-size", type=int, default=risk_streaming.DEFAULT_CHUNK_SIZE, help="Rows scored per chunk within a file")
+    parser.add_argument("--output-dir", default=".", help="Where to write portfolio_<method>.csv")
+    args = parser.parse_args()
+
+    paths = find_registers(args.inputs)
+    if not paths:
+        parser.error("No .xlsx registers matched the given inputs.")
+
+    print(f"Scoring {len(paths)} registers...")
+    merged, _ = score_portfolio(paths, args.top_k, args.workers, args.chunk_size, on_result=print_result)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for method in merged.methods:
+        ranking = ranking_frame(merged, method)
+        if ranking is None:
+            print(f"\n{method.upper()}: no valid risks in any register")
+            continue
+        file_name = os.path.join(args.output_dir, f"portfolio_{method.replace(' ', '_')}.csv")
+        ranking.to_csv(file_name, index=False)
+        print(f"\n{method.upper()} Top {min(5, len(ranking))} of {merged.valid_counts[method]} valid risks ({merged.error_counts[method]} errors):")
+        print(ranking.head(5).to_string(index=False))
+        print(f"Full ranking saved to '{file_name}'")
+
+
+if __name__ == "__main__":
+    main()
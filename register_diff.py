@@ -0,0 +1,146 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import risk_scoring
+
+MAX_REPORTED_MOVES = 20
+
+
+def name_key(file_name):
+    # Store key for "the latest version of the register uploaded as file_name".
+    return hashlib.sha256(file_name.strip().lower().encode("utf-8")).hexdigest()[:32]
+
+
+def diff_registers(old_df, new_df):
+    # Matches rows on Risk Name. Returns None when Risk Name is not unique in
+    # either frame, as rows can then not be matched reliably; otherwise a dict
+    # with the added, removed and changed names, "old_positions" (each new
+    # row's position in old_df, -1 if added) and "dirty" (new rows that must
+    # be rescored: added or changed in any shared column).
+    if not old_df["Risk Name"].is_unique or not new_df["Risk Name"].is_unique:
+        return None
+    names = new_df["Risk Name"]
+    old_positions = pd.Index(old_df["Risk Name"]).get_indexer(names)
+    present = old_positions >= 0
+
+    changed = np.zeros(len(new_df), dtype=bool)
+    matched = old_positions[present]
+    for col in new_df.columns:
+        if col == "Risk Name" or col not in old_df.columns:
+            continue
+        old_values = old_df[col].to_numpy(dtype=object)[matched]
+        new_values = new_df[col].to_numpy(dtype=object)[present]
+        same = pd.isna(old_values) & pd.isna(new_values)
+        same |= old_values == new_values
+        changed[present] |= ~same
+
+    kept = np.zeros(len(old_df), dtype=bool)
+    kept[matched] = True
+    return {
+        "added": names[~present].tolist(),
+        "removed": old_df["Risk Name"][~kept].tolist(),
+        "changed": names[changed].tolist(),
+        "old_positions": old_positions,
+        "dirty": ~present | changed,
+    }
+
+
+def ranks_by_position(result, index):
+    # 1-based rank of every row of the frame result was scored from (index is
+    # that frame's index), 0 for rows the method rejected.
+    ranks = np.zeros(len(index), dtype=np.int64)
+    if result is not None:
+        ranks[index.get_indexer(result.index)] = np.arange(1, len(result) + 1)
+    return ranks
+
+
+def rank_moves(old_df, old_results, new_df, new_results, diff, top_n=10):
+    # Per method: how the added and changed risks now rank against their old
+    # rank (largest moves first), and which of them entered or left the top_n.
+    moves = {}
+    dirty = np.flatnonzero(diff["dirty"])
+    old_positions = diff["old_positions"]
+    for method, (new_result, _) in new_results.items():
+        old_result = old_results.get(method, (None, None))[0]
+        old_ranks = ranks_by_position(old_result, old_df.index)
+        new_ranks = ranks_by_position(new_result, new_df.index)
+        moved = []
+        for pos in dirty:
+            old_rank = int(old_ranks[old_positions[pos]]) if old_positions[pos] >= 0 else 0
+            new_rank = int(new_ranks[pos])
+            if old_rank != new_rank:
+                name = new_df["Risk Name"].iat[pos]
+                moved.append({
+                    "risk": name.item() if isinstance(name, np.generic) else name,
+                    "old_rank": old_rank or None,
+                    "new_rank": new_rank or None,
+                })
+        moved.sort(key=lambda move: -abs((move["old_rank"] or len(old_ranks) + 1) - (move["new_rank"] or len(new_ranks) + 1)))
+        # Only risks that were added, changed or removed are reported as
+        # entering or leaving the top_n; tied scores can swap places between
+        # any two sorts and would otherwise show up as noise.
+        touched = set(diff["added"]) | set(diff["changed"]) | set(diff["removed"])
+        old_top = [] if old_result is None else old_result["Risk Name"].head(top_n).tolist()
+        new_top = [] if new_result is None else new_result["Risk Name"].head(top_n).tolist()
+        moves[method] = {
+            "count": len(moved),
+            "largest": moved[:MAX_REPORTED_MOVES],
+            "entered_top": [name for name in new_top if name in touched and name not in old_top],
+            "left_top": [name for name in old_top if name in touched and name not in new_top],
+        }
+    return moves
+
+
+def rescore(old_df, old_results, new_df, methods=None):
+    # Scores new_df reusing the scores of rows that are unchanged since
+    # old_df. Only added and changed rows, and rows that were rejected before
+    # (so their messages carry the new row numbers), go through score_methods.
+    # Returns (results, summary) with results shaped like score_methods, or
+    # None when the two versions cannot be matched row by row.
+    methods = risk_scoring.METHODS if methods is None else methods
+    diff = diff_registers(old_df, new_df)
+    if diff is None:
+        return None
+    new_df = new_df.reset_index(drop=True)
+    present = diff["old_positions"] >= 0
+
+    results = {}
+    rescored_rows = 0
+    for method in methods:
+        old_result = old_results.get(method, (None, None))[0]
+        score_column = risk_scoring.get_score_column(method)
+        old_scores = np.full(len(old_df), np.nan)
+        if old_result is not None:
+            old_scores[old_df.index.get_indexer(old_result.index)] = old_result[score_column].to_numpy(dtype="float64")
+        scores = np.full(len(new_df), np.nan)
+        scores[present] = old_scores[diff["old_positions"][present]]
+        scores[diff["dirty"]] = np.nan
+
+        todo = np.flatnonzero(np.isnan(scores))
+        rescored_rows = max(rescored_rows, len(todo))
+        errors = []
+        if len(todo):
+            result, errors = risk_scoring.calculate_risk(new_df.iloc[todo], method)
+            if result is not None:
+                scores[result.index.to_numpy()] = result[score_column].to_numpy(dtype="float64")
+
+        valid = ~np.isnan(scores)
+        if not valid.any():
+            results[method] = (None, errors)
+            continue
+        # Same construction as score_methods, so the frame matches a full rescore.
+        result = new_df.loc[valid].copy()
+        result[score_column] = scores[valid]
+        results[method] = (result.sort_values(by=score_column, ascending=False), errors)
+
+    summary = {
+        "added": diff["added"],
+        "removed": diff["removed"],
+        "changed": diff["changed"],
+        "rescored_rows": rescored_rows,
+        "total_rows": len(new_df),
+        "moves": rank_moves(old_df, old_results, new_df, results, diff),
+    }
+    return results, summary
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def make_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def estimate_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    return 64
+
+
+class ResultCache:
+    # In-process LRU cache of assessment entries keyed by the hash of the
+    # uploaded bytes, evicted by entry count, total size and age. With disk_dir
+    # set, entries are also pickled there so other workers and restarts can
+    # pick them up.
+    def __init__(self, max_entries=32, max_bytes=512 * 1024 * 1024, max_age=3600, disk_dir=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None:
+                created, size, entry = item
+                if now - created <= self.max_age:
+                    self.entries.move_to_end(key)
+                    return entry
+                self._remove(key)
+
+        entry = self._load_from_disk(key, now)
+        if entry is not None:
+            self.put(key, entry, write_disk=False)
+        return entry
+
+    def put(self, key, entry, write_disk=True):
+        size = estimate_size(entry)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if size <= self.max_bytes:
+                self.entries[key] = (time.time(), size, entry)
+                self.total_bytes += size
+                self._evict()
+        if write_disk:
+            self._save_to_disk(key, entry)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, (created, _, _) in self.entries.items() if now - created > self.max_age]:
+            self._remove(key)
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            self._remove(next(iter(self.entries)))
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _save_to_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _load_from_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if now - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
@@ -0,0 +1,245 @@
+import importlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import risk_scoring
+
+EXPORT_CHUNK_ROWS = 10000
+# Chunk size, in bytes, for formats that are built in a temporary file first.
+FILE_CHUNK_BYTES = 1024 * 1024
+
+EXPORT_FORMATS = {
+    "txt": ("text/plain", "txt"),
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+# Formats that need an optional package: format -> module.
+FORMAT_MODULES = {
+    "parquet": "pyarrow.parquet",
+}
+# Most decimals the txt report prints, DataFrame.to_string's default precision.
+REPORT_MAX_DECIMALS = 6
+
+
+def format_available(fmt):
+    # False when the format's optional package is missing or fails to import.
+    module = FORMAT_MODULES.get(fmt)
+    if module is None:
+        return True
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        return False
+    return True
+
+
+def export_sections(results, method, top_n=3):
+    # The report layout: every risk for the selected method, the top_n risks
+    # for the others, in the order the methods were scored.
+    sections = []
+    for m in results:
+        df, _ = results[m]
+        if df is None:
+            continue
+        sections.append((m, df if m == method else df.head(top_n)))
+    return sections
+
+
+def section_frame(method, df):
+    # The method's result columns, prefixed with Method and its 1-based Rank.
+    frame = df[risk_scoring.get_result_columns(method)].reset_index(drop=True)
+    frame.insert(0, "Rank", np.arange(1, len(frame) + 1))
+    frame.insert(0, "Method", method)
+    return frame
+
+
+def union_columns(sections):
+    columns = ["Method", "Rank"]
+    for method, _ in sections:
+        for col in risk_scoring.get_result_columns(method):
+            if col not in columns:
+                columns.append(col)
+    return columns
+
+
+def iter_chunks(sections, columns=None):
+    for method, df in sections:
+        for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+            frame = section_frame(method, df.iloc[start:start + EXPORT_CHUNK_ROWS])
+            frame["Rank"] += start
+            yield method, (frame if columns is None else frame.reindex(columns=columns))
+
+
+def float_format(values):
+    # The format to_string gives a float column: the fewest decimals, 1 to
+    # REPORT_MAX_DECIMALS, that show every value, or scientific notation when
+    # a nonzero value would print as 0 or large values make the column too wide.
+    finite = values[np.isfinite(values)]
+    full = np.round(finite, REPORT_MAX_DECIMALS)
+    decimals = next((d for d in range(1, REPORT_MAX_DECIMALS) if np.array_equal(np.round(finite, d), full)), REPORT_MAX_DECIMALS)
+    magnitudes = np.abs(finite)
+    small = ((magnitudes < 10 ** -REPORT_MAX_DECIMALS) & (magnitudes > 0)).any()
+    # The widest value is the largest or the most negative one.
+    width = max(len(f"{value:.{decimals}f}") for value in (finite.max(), finite.min())) if len(finite) else 0
+    large = (magnitudes > 1e6).any() and width > REPORT_MAX_DECIMALS + 6
+    if small or large:
+        return f"{{:.{REPORT_MAX_DECIMALS}e}}"
+    return f"{{:.{decimals}f}}"
+
+
+def cell_text(value):
+    if isinstance(value, float) and np.isnan(value):
+        return "NaN"
+    return str(value)
+
+
+def format_cells(chunk, formats):
+    # One list of cell strings per column of chunk.
+    cells = []
+    for col in chunk.columns:
+        if col in formats:
+            fmt = formats[col]
+            cells.append(["NaN" if np.isnan(value) else fmt.format(value) for value in chunk[col].to_numpy(dtype="float64")])
+        else:
+            cells.append([cell_text(value) for value in chunk[col].tolist()])
+    return cells
+
+
+def iter_fixed_width(df):
+    # df.to_string(index=False) in EXPORT_CHUNK_ROWS pieces. Float formats
+    # come from the whole column and column widths from a first pass over the
+    # chunks, so only one chunk's text is held at a time.
+    if df.empty:
+        yield df.to_string(index=False)
+        return
+    columns = list(df.columns)
+    formats = {col: float_format(df[col].to_numpy(dtype="float64")) for col in columns if pd.api.types.is_float_dtype(df[col])}
+    # to_string leaves room for a sign in front of numeric headings.
+    headers = [" " + str(col) if pd.api.types.is_numeric_dtype(df[col]) else str(col) for col in columns]
+    widths = [len(header) for header in headers]
+    for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+        cells = format_cells(df.iloc[start:start + EXPORT_CHUNK_ROWS], formats)
+        widths = [max(width, max(map(len, column))) for width, column in zip(widths, cells)]
+    yield " ".join(header.rjust(width) for header, width in zip(headers, widths))
+    for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+        cells = format_cells(df.iloc[start:start + EXPORT_CHUNK_ROWS], formats)
+        yield "".join("\n" + " ".join(text.rjust(width) for text, width in zip(row, widths)) for row in zip(*cells))
+
+
+def iter_report(results, method):
+    # The legacy risk_assessment_results.txt layout, one section at a time;
+    # the full section is written in chunks.
+    for m in results:
+        df, _ = results[m]
+        if df is None:
+            continue
+        if m == method:
+            yield f"{m.upper()} Results (All Risks):\n"
+            yield from iter_fixed_width(df)
+        else:
+            yield f"\n\n{m.upper()} Top 3 Risks:\n"
+            yield df.head(3).to_string(index=False)
+        yield "\n"
+
+
+def iter_csv(sections):
+    # One CSV over the union of the sections' columns, blank where a column
+    # does not apply to the row's method.
+    columns = union_columns(sections)
+    header = True
+    for _, frame in iter_chunks(sections, columns):
+        yield frame.to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield pd.DataFrame(columns=columns).to_csv(index=False)
+
+
+def iter_jsonl(sections):
+    for _, frame in iter_chunks(sections):
+        chunk = frame.to_json(orient="records", lines=True, force_ascii=False)
+        yield chunk if chunk.endswith("\n") else chunk + "\n"
+
+
+def iter_file(tmp):
+    tmp.seek(0)
+    try:
+        while True:
+            block = tmp.read(FILE_CHUNK_BYTES)
+            if not block:
+                break
+            yield block
+    finally:
+        tmp.close()
+
+
+def iter_xlsx(sections):
+    # One sheet per method, written row by row with openpyxl's write-only mode
+    # into a spooled temporary file, then streamed out.
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for method, df in sections:
+        sheet = workbook.create_sheet(title=method.upper()[:31])
+        sheet.append(["Rank"] + risk_scoring.get_result_columns(method))
+        for _, frame in iter_chunks([(method, df)]):
+            frame = frame.drop(columns="Method")
+            frame = frame.astype(object).where(frame.notna(), None)
+            for row in frame.itertuples(index=False, name=None):
+                sheet.append([value.item() if isinstance(value, np.generic) else value for value in row])
+    tmp = tempfile.SpooledTemporaryFile(max_size=16 * FILE_CHUNK_BYTES)
+    workbook.save(tmp)
+    yield from iter_file(tmp)
+
+
+def iter_parquet(sections):
+    # Row group per chunk over the union of columns; the file is assembled in
+    # a spooled temporary file because Parquet writes its footer last.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = union_columns(sections)
+    tmp = tempfile.SpooledTemporaryFile(max_size=16 * FILE_CHUNK_BYTES)
+    writer = None
+    schema = None
+    for _, frame in iter_chunks(sections, columns):
+        for col in columns[2:]:
+            if col in ("Risk Name", "Task Affected"):
+                frame[col] = frame[col].astype(object).where(frame[col].notna(), None).map(lambda v: v if v is None else str(v))
+            else:
+                frame[col] = pd.to_numeric(frame[col], errors="coerce").astype("float64")
+        table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+        if writer is None:
+            schema = table.schema
+            writer = pq.ParquetWriter(tmp, schema)
+        writer.write_table(table)
+    if writer is None:
+        empty = pd.DataFrame({col: pd.Series(dtype=object if col in ("Method", "Risk Name", "Task Affected") else "float64") for col in columns})
+        pq.write_table(pa.Table.from_pandas(empty, preserve_index=False), tmp)
+    else:
+        writer.close()
+    yield from iter_file(tmp)
+
+
+def iter_export(results, method, fmt):
+    # Returns a generator of str/bytes chunks for the given export format.
+    # Nothing is built until the generator is iterated, so a response can
+    # start before the export is complete. A missing optional package raises
+    # ImportError here rather than part way through the response.
+    if fmt in FORMAT_MODULES:
+        importlib.import_module(FORMAT_MODULES[fmt])
+    if fmt == "txt":
+        return iter_report(results, method)
+    sections = export_sections(results, method)
+    if fmt == "csv":
+        return iter_csv(sections)
+    if fmt == "jsonl":
+        return iter_jsonl(sections)
+    if fmt == "xlsx":
+        return iter_xlsx(sections)
+    if fmt == "parquet":
+        return iter_parquet(sections)
+    raise ValueError(f"Unsupported export format: {fmt}")
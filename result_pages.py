@@ -0,0 +1,111 @@
+import math
+import numbers
+import threading
+
+import numpy as np
+import pandas as pd
+
+import risk_scoring
+import task_rollup
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+sort_lock = threading.Lock()
+
+
+def mixed_sort_key(values):
+    # Sort key for an object column holding several types (Excel gives ints
+    # and strings side by side in a name column): numbers first, by value,
+    # then everything else by its text. Missing values stay missing.
+    return values.map(lambda value: value if pd.isna(value) else (0, value) if isinstance(value, numbers.Number) else (1, str(value)))
+
+
+def sort_order(entry, method, column, ascending):
+    # Row positions of the method's result frame sorted by column, computed
+    # once and kept on the cached entry so later pages and repeat sorts only
+    # slice it. column None is the frame's own order (score, highest first).
+    df, _ = entry["results"][method]
+    if column is None:
+        return np.arange(len(df))
+    key = (method, column, ascending)
+    with sort_lock:
+        orders = entry.setdefault("sort_orders", {})
+        order = orders.get(key)
+    if order is None:
+        positions = df[column].reset_index(drop=True)
+        try:
+            order = positions.sort_values(ascending=ascending, kind="stable", na_position="last")
+        except TypeError:
+            order = positions.sort_values(ascending=ascending, kind="stable", na_position="last", key=mixed_sort_key)
+        order = order.index.to_numpy()
+        with sort_lock:
+            orders[key] = order
+    return order
+
+
+def filter_mask(df, method, task=None, min_score=None, max_score=None):
+    if task is None and min_score is None and max_score is None:
+        return None
+    mask = np.ones(len(df), dtype=bool)
+    if task is not None:
+        mask &= (df["Task Affected"].astype(str) == task).to_numpy()
+    scores = df[risk_scoring.get_score_column(method)].to_numpy(dtype="float64")
+    if min_score is not None:
+        mask &= scores >= min_score
+    if max_score is not None:
+        mask &= scores <= max_score
+    return mask
+
+
+def get_page(entry, method, page=1, page_size=DEFAULT_PAGE_SIZE, sort=None, ascending=False, task=None, min_score=None, max_score=None):
+    # Returns (page frame, total matching rows, page count, resolved page).
+    # Unfiltered pages cost O(page_size); filters add one mask over the frame.
+    df, _ = entry["results"][method]
+    columns = risk_scoring.get_result_columns(method)
+    if sort is not None and sort not in columns:
+        raise ValueError(f"Cannot sort {method.upper()} results by {sort}")
+    page_size = min(max(int(page_size), 1), MAX_PAGE_SIZE)
+
+    order = sort_order(entry, method, sort, ascending)
+    mask = filter_mask(df, method, task, min_score, max_score)
+    if mask is not None:
+        order = order[mask[order]]
+
+    total = len(order)
+    pages = max(math.ceil(total / page_size), 1)
+    page = min(max(int(page), 1), pages)
+    start = (page - 1) * page_size
+    rows = df.iloc[order[start:start + page_size]][columns]
+    return rows, total, pages, page
+
+
+def page_payload(rows, total, pages, page, page_size):
+    records = rows.astype(object).where(rows.notna(), None)
+    return {
+        "columns": list(rows.columns),
+        "rows": [[value.item() if isinstance(value, np.generic) else value for value in row] for row in records.itertuples(index=False, name=None)],
+        "total": total,
+        "pages": pages,
+        "page": page,
+        "page_size": page_size,
+    }
+
+
+def task_values(entry, method, limit=500):
+    # Distinct Task Affected values for the filter control, cached on the entry.
+    key = ("tasks", method)
+    with sort_lock:
+        orders = entry.setdefault("sort_orders", {})
+        values = orders.get(key)
+    if values is None:
+        rollup = entry.get("rollup")
+        if rollup and method in rollup:
+            # The rollup covers every scored row, also when df is a streamed top-K.
+            values = sorted(row["task"] for row in rollup[method]["tasks"] if row["task"] != task_rollup.BLANK_TASK)[:limit]
+        else:
+            df, _ = entry["results"][method]
+            values = sorted(df["Task Affected"].dropna().astype(str).unique().tolist())[:limit]
+        with sort_lock:
+            orders[key] = values
+    return values
@@ -0,0 +1,146 @@
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+import pandas as pd
+
+import result_pages
+import risk_scoring
+
+# Treeview's default row height in pixels, used when the theme does not set one.
+DEFAULT_ROW_HEIGHT = 20
+ARROWS = {True: " ▲", False: " ▼"}
+
+
+def precompute_orders(df, method):
+    # Ascending row order of every result column, in the sort_orders form
+    # result_pages.sort_order caches, so the first click on any heading is a
+    # lookup. Meant for a worker thread; descending orders are built on demand,
+    # as are the orders of any column that cannot be sorted here.
+    entry = {"results": {method: (df, [])}, "sort_orders": {}}
+    for column in risk_scoring.get_result_columns(method):
+        try:
+            result_pages.sort_order(entry, method, column, True)
+        except (TypeError, ValueError):
+            continue
+    return entry["sort_orders"]
+
+
+class VirtualGrid:
+    # A Treeview over a method's result frame that holds one item per visible
+    # line. Scrolling rewrites those items from the frame's column arrays, so
+    # a 1M-row result opens as fast as a 20-row one. Clicking a heading sorts
+    # by that column (ascending first, then toggling) through
+    # result_pages.sort_order.
+    def __init__(self, parent, height=10):
+        self.scroll_y = tk.Scrollbar(parent, orient=tk.VERTICAL, command=self.yview)
+        self.scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.scroll_x = tk.Scrollbar(parent, orient=tk.HORIZONTAL)
+        self.scroll_x.pack(side=tk.BOTTOM, fill=tk.X)
+
+        self.tree = ttk.Treeview(parent, show="headings", xscrollcommand=self.scroll_x.set, height=height)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.scroll_x.config(command=self.tree.xview)
+
+        self.tree.bind("<Configure>", self.resize)
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-1, "units"))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(1, "units"))
+
+        self.height = height
+        self.method = None
+        self.columns = []
+        self.data = []
+        self.entry = None
+        self.order = np.arange(0)
+        self.top = 0
+        self.sort = None
+        self.ascending = True
+
+    def show(self, df, method, orders=None, keep_view=False):
+        # Displays df (a result frame, highest score first), or no rows when
+        # df is None. orders are precomputed sort orders for it; keep_view
+        # keeps the sort and scroll position, for a refresh after a what-if edit.
+        if df is None:
+            df = pd.DataFrame(columns=risk_scoring.get_result_columns(method))
+        keep_view = keep_view and method == self.method
+        self.method = method
+        self.columns = risk_scoring.get_result_columns(method)
+        self.data = [df[col].to_numpy() for col in self.columns]
+        self.entry = {"results": {method: (df, [])}, "sort_orders": orders or {}}
+
+        self.tree["columns"] = self.columns
+        for col in self.columns:
+            self.tree.heading(col, text=col, command=lambda col=col: self.sort_by(col))
+            self.tree.column(col, width=120, anchor="center")
+
+        if keep_view and self.sort is not None:
+            self.apply_sort(self.sort, self.ascending)
+        else:
+            self.sort = None
+            self.order = np.arange(len(df))
+            self.top = 0
+        self.refresh()
+
+    def sort_by(self, column):
+        if self.entry is None:
+            return
+        ascending = not (self.sort == column and self.ascending)
+        try:
+            self.apply_sort(column, ascending)
+        except (TypeError, ValueError):
+            return
+        self.top = 0
+        self.refresh()
+
+    def apply_sort(self, column, ascending):
+        self.order = result_pages.sort_order(self.entry, self.method, column, ascending)
+        self.sort = column
+        self.ascending = ascending
+        for col in self.columns:
+            self.tree.heading(col, text=col + (ARROWS[ascending] if col == column else ""))
+
+    def row_values(self, position):
+        values = [data[position] for data in self.data]
+        values[-1] = f"{values[-1]:.2f}"
+        return values
+
+    def refresh(self):
+        # Rewrites the visible items: row positions order[top:top + height].
+        total = len(self.order)
+        self.top = min(max(self.top, 0), max(total - self.height, 0))
+        positions = self.order[self.top:self.top + self.height]
+        items = self.tree.get_children()
+        for iid in items[len(positions):]:
+            self.tree.delete(iid)
+        for i, position in enumerate(positions.tolist()):
+            if i < len(items):
+                self.tree.item(items[i], values=self.row_values(position))
+            else:
+                self.tree.insert("", tk.END, values=self.row_values(position))
+        if total:
+            self.scroll_y.set(self.top / total, min(self.top + self.height, total) / total)
+        else:
+            self.scroll_y.set(0, 1)
+
+    def yview(self, action, amount, unit=None):
+        # Scrollbar command: ("moveto", fraction) or ("scroll", n, "units"/"pages").
+        if action == "moveto":
+            self.top = int(float(amount) * len(self.order))
+            self.refresh()
+        else:
+            self.scroll(int(amount), unit)
+
+    def scroll(self, amount, unit):
+        self.top += amount * (self.height if unit == "pages" else 1)
+        self.refresh()
+        return "break"
+
+    def resize(self, event):
+        # Shows as many lines as fit; one line's worth is left for the headings.
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or DEFAULT_ROW_HEIGHT)
+        height = max(event.height // row_height - 1, 1)
+        if height != self.height:
+            self.height = height
+            self.refresh()
@@ -1,18 +1,49 @@
-from flask import Flask, render_template, request, send_file
+from flask import Flask, Response, g, jsonify, redirect, render_template, request, send_from_directory, stream_with_context, url_for
 import pandas as pd
-import matplotlib.pyplot as plt
+import hashlib
+import multiprocessing
 import os
-import io
-import base64
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import assessment_history
+import assessment_store
+import chart_renderer
+import job_runner
+import lca_service
+import result_cache
+import result_export
+import result_pages
+import register_diff
+import risk_scoring
+import risk_streaming
+import risk_uncertainty
+import score_api
+import task_rollup
+import what_if
 
 app = Flask(__name__)
 
 UPLOAD_FOLDER = "uploads"
+# Uploads are copied to disk and hashed in blocks of this many bytes.
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 CHART_FOLDER = "static/charts"
+# Retry-After, in seconds, for a chart that is not on disk yet.
+CHART_RETRY_SECONDS = 2
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(CHART_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# .xlsx uploads above this size are scored chunk by chunk instead of loaded whole.
+app.config['STREAMING_THRESHOLD_BYTES'] = int(os.environ.get("STREAMING_THRESHOLD_MB", 20)) * 1024 * 1024
+app.config['STREAMING_CHUNK_SIZE'] = int(os.environ.get("STREAMING_CHUNK_SIZE", risk_streaming.DEFAULT_CHUNK_SIZE))
+app.config['STREAMING_TOP_K'] = int(os.environ.get("STREAMING_TOP_K", risk_streaming.DEFAULT_TOP_K))
+app.config['RESULTS_PAGE_SIZE'] = int(os.environ.get("RESULTS_PAGE_SIZE", result_pages.DEFAULT_PAGE_SIZE))
+# Uncertainty runs up to this many draws (samples x risks) are answered in the
+# request; larger ones run as a background job.
+app.config['UNCERTAINTY_SYNC_DRAWS'] = int(os.environ.get("UNCERTAINTY_SYNC_DRAWS", 20000000))
+app.config['UNCERTAINTY_MAX_SAMPLES'] = int(os.environ.get("UNCERTAINTY_MAX_SAMPLES", 100000))
+app.config['ROLLUP_TASKS_SHOWN'] = int(os.environ.get("ROLLUP_TASKS_SHOWN", 20))
 
 class RiskAssessmentApp:
     def __init__(self):
@@ -21,155 +52,349 @@ class RiskAssessmentApp:
         self.results = {}
 
     def get_required_columns(self):
-        return [
-            "Risk Name",
-            "Probability (%)",
-            "Impact (Severity)",
-            "Detection",
-            "Probability",
-            "Impact",
-            "Cause Likelihood",
-            "Consequence Severity",
-            "Barrier Effectiveness",
-            "Task Affected"
-        ]
+        return list(risk_scoring.REQUIRED_COLUMNS)
 
     def get_result_columns(self, method):
-        if method == "fmea":
-            return ["Risk Name", "Probability (%)", "Impact (Severity)", "Detection", "Task Affected", "RPN"]
-        elif method == "risk matrix":
-            return ["Risk Name", "Probability", "Impact", "Task Affected", "Risk Score"]
-        elif method == "bow-tie":
-            return ["Risk Name", "Cause Likelihood", "Consequence Severity", "Barrier Effectiveness", "Task Affected", "Barrier Score"]
+        return risk_scoring.get_result_columns(method)
 
     def calculate_risk(self, method):
-        valid_rows = []
-        errors = []
-        for idx, row in self.df.iterrows():
-            try:
-                risk_name = str(row["Risk Name"])
-                task_affected = str(row["Task Affected"])
-                if pd.isna(risk_name) or pd.isna(task_affected):
-                    errors.append(f"Row {idx + 2}: Missing or invalid Risk Name or Task Affected ({method.upper()})")
-                    continue
-
-                if method == "fmea":
-                    prob = float(row["Probability (%)"])
-                    impact = float(row["Impact (Severity)"])
-                    detection = float(row["Detection"])
-                    if pd.isna(prob) or pd.isna(impact) or pd.isna(detection):
-                        errors.append(f"Row {idx + 2}: Missing or invalid data in one of the columns (FMEA)")
-                        continue
-                    if not (0 <= prob <= 100):
-                        errors.append(f"Row {idx + 2}: Probability (%) must be between 0 and 100, got {prob} (FMEA)")
-                        continue
-                    if not (1 <= impact <= 10):
-                        errors.append(f"Row {idx + 2}: Impact (Severity) must be between 1 and 10, got {impact} (FMEA)")
-                        continue
-                    if not (1 <= detection <= 10):
-                        errors.append(f"Row {idx + 2}: Detection must be between 1 and 10, got {detection} (FMEA)")
-                        continue
-                    score = (prob / 100) * impact * detection
-                    row["RPN"] = score
-                    valid_rows.append(row)
-
-                elif method == "risk matrix":
-                    prob = float(row["Probability"])
-                    impact = float(row["Impact"])
-                    if pd.isna(prob) or pd.isna(impact):
-                        errors.append(f"Row {idx + 2}: Missing or invalid data in one of the columns (Risk Matrix)")
-                        continue
-                    if not (1 <= prob <= 5):
-                        errors.append(f"Row {idx + 2}: Probability must be between 1 and 5, got {prob} (Risk Matrix)")
-                        continue
-                    if not (1 <= impact <= 5):
-                        errors.append(f"Row {idx + 2}: Impact must be between 1 and 5, got {impact} (Risk Matrix)")
-                        continue
-                    score = prob * impact
-                    row["Risk Score"] = score
-                    valid_rows.append(row)
-
-                elif method == "bow-tie":
-                    cause_likelihood = float(row["Cause Likelihood"])
-                    consequence_severity = float(row["Consequence Severity"])
-                    barrier_effectiveness = float(row["Barrier Effectiveness"])
-                    if pd.isna(cause_likelihood) or pd.isna(consequence_severity) or pd.isna(barrier_effectiveness):
-                        errors.append(f"Row {idx + 2}: Missing or invalid data in one of the columns (Bow-Tie)")
-                        continue
-                    if not (1 <= cause_likelihood <= 5):
-                        errors.append(f"Row {idx + 2}: Cause Likelihood must be between 1 and 5, got {cause_likelihood} (Bow-Tie)")
-                        continue
-                    if not (1 <= consequence_severity <= 5):
-                        errors.append(f"Row {idx + 2}: Consequence Severity must be between 1 and 5, got {consequence_severity} (Bow-Tie)")
-                        continue
-                    if not (1 <= barrier_effectiveness <= 5):
-                        errors.append(f"Row {idx + 2}: Barrier Effectiveness must be between 1 and 5, got {barrier_effectiveness} (Bow-Tie)")
-                        continue
-                    score = (cause_likelihood * consequence_severity) / barrier_effectiveness
-                    row["Barrier Score"] = score
-                    valid_rows.append(row)
-
-            except (ValueError, TypeError) as e:
-                errors.append(f"Row {idx + 2}: Invalid data - {str(e)} ({method.upper()})")
-
-        if not valid_rows:
-            return None, errors
-        df = pd.DataFrame(valid_rows)
-        score_column = "RPN" if method == "fmea" else "Risk Score" if method == "risk matrix" else "Barrier Score"
-        df = df.sort_values(by=score_column, ascending=False)
-        return df, errors
+        return risk_scoring.calculate_risk(self.df, method)
+
+    def calculate_all(self):
+        return risk_scoring.score_methods(self.df)
+
+    def stream_file(self, file_path, chunk_size, top_k, on_chunk=None):
+        streamed = risk_streaming.stream_assessment(file_path, chunk_size=chunk_size, top_k=top_k, on_chunk=on_chunk)
+        # The register is never held in memory as a whole: results keep the
+        # running top-K per method and the comparison covers those risks.
+        self.df = None
+        self.results = streamed.as_results()
+        names = {}
+        for df, _ in self.results.values():
+            if df is not None:
+                names.update(dict.fromkeys(df["Risk Name"].tolist()))
+        self.original_risk_names = list(names)
+        return streamed
 
     def normalize_score(self, score, method):
-        if method == "fmea":
-            return score
-        elif method == "risk matrix":
-            return ((score - 1) / (25 - 1)) * 100
-        elif method == "bow-tie":
-            return ((score - 0.2) / (25 - 0.2)) * 100
-        return score
+        return risk_scoring.normalize_score(score, method)
+
+    def combined_score_matrix(self):
+        row_index = self.df.index if self.df is not None else None
+        return risk_scoring.align_scores(self.results, self.original_risk_names, row_index)
+
+    def add_environmental_impact(self, service):
+        # GWP and acidification per risk from the warm LCA service, added to
+        # results (and so to the comparison chart) as a fourth method.
+        result, errors = service.score(self.df)
+        if result is not None:
+            self.results[risk_scoring.ENVIRONMENTAL] = (result, errors)
+        return errors
 
     def plot_combined_scores(self):
         if not self.results:
             return None
-
-        plt.figure(figsize=(12, 8))
-        risk_names = self.original_risk_names
-        y_positions = range(len(risk_names))
-
-        scores = {"fmea": [], "risk matrix": [], "bow-tie": []}
-        for risk in risk_names:
-            for method in self.results:
-                df, _ = self.results[method]
-                score_column = "RPN" if method == "fmea" else "Risk Score" if method == "risk matrix" else "Barrier Score"
-                score = df[df["Risk Name"] == risk][score_column].values
-                normalized_score = self.normalize_score(score[0] if len(score) > 0 else 0, method)
-                scores[method].append(normalized_score)
-
-        plt.scatter(scores["fmea"], y_positions, color="red", label="FMEA (RPN)", s=100)
-        plt.scatter(scores["risk matrix"], y_positions, color="green", label="Risk Matrix (Risk Score)", s=100)
-        plt.scatter(scores["bow-tie"], y_positions, color="blue", label="Bow-Tie (Barrier Score)", s=100)
-
-        for i in range(len(risk_names)):
-            plt.plot([scores["fmea"][i], scores["risk matrix"][i]], [i, i], color="gray", linestyle="--", alpha=0.5)
-            plt.plot([scores["risk matrix"][i], scores["bow-tie"][i]], [i, i], color="gray", linestyle="--", alpha=0.5)
-            plt.plot([scores["bow-tie"][i], scores["fmea"][i]], [i, i], color="gray", linestyle="--", alpha=0.5)
-
-        plt.yticks(y_positions, risk_names)
-        plt.xlabel("Normalized Score (0 to 100)")
-        plt.ylabel("Risk Name")
-        plt.title("Comparison of Risk Scores Across Methods")
-        plt.xlim(0, 100)
-        plt.legend()
-        plt.grid(True, which="both", linestyle="--", alpha=0.7)
-        plt.tight_layout()
-
-        buf = io.BytesIO()
-        plt.savefig(buf, format="png")
-        buf.seek(0)
-        plt.close()
-        return buf
-
-risk_app = RiskAssessmentApp()
+        return chart_renderer.render_combined_png(self.combined_score_matrix())
+
+# Set ASSESSMENT_STORE_DIR to a directory shared by all workers when running
+# more than one process; results and cached entries are then kept on disk there.
+ASSESSMENT_STORE_DIR = os.environ.get("ASSESSMENT_STORE_DIR") or None
+
+upload_cache = result_cache.ResultCache(
+    max_entries=int(os.environ.get("RESULT_CACHE_ENTRIES", 32)),
+    max_bytes=int(os.environ.get("RESULT_CACHE_MB", 512)) * 1024 * 1024,
+    max_age=int(os.environ.get("RESULT_CACHE_TTL", 3600)),
+    disk_dir=os.environ.get("RESULT_CACHE_DIR") or (os.path.join(ASSESSMENT_STORE_DIR, "entries") if ASSESSMENT_STORE_DIR else None)
+)
+results_store = assessment_store.make_store(
+    os.path.join(ASSESSMENT_STORE_DIR, "results") if ASSESSMENT_STORE_DIR else None,
+    max_age=int(os.environ.get("RESULT_STORE_TTL", 24 * 3600))
+)
+# Latest upload key per client and register file name, so a new version of a
+# register is scored against the same client's previous one instead of from
+# scratch. Clients are told apart by the CLIENT_COOKIE, a random ID.
+register_versions = assessment_store.make_store(
+    os.path.join(ASSESSMENT_STORE_DIR, "registers") if ASSESSMENT_STORE_DIR else None,
+    max_age=int(os.environ.get("RESULT_STORE_TTL", 24 * 3600))
+)
+CLIENT_COOKIE = "client_id"
+# What-if sessions: an editable, incrementally re-ranked copy of a result.
+what_if_sessions = assessment_store.make_store(
+    os.path.join(ASSESSMENT_STORE_DIR, "what_if") if ASSESSMENT_STORE_DIR else None,
+    max_age=int(os.environ.get("RESULT_STORE_TTL", 24 * 3600))
+)
+# An edit reads a result's session, changes it and stores it back under the
+# result's lock, so concurrent edits to one result do not drop each other.
+# Locks are shared by results whose IDs fall in the same stripe.
+what_if_locks = [threading.Lock() for _ in range(64)]
+
+def what_if_lock(result_id):
+    return what_if_locks[int(result_id, 16) % len(what_if_locks)]
+
+# Every computed assessment is appended to the SQLite history on one
+# background thread, so uploads do not wait for the insert.
+history = assessment_history.HistoryStore(
+    os.environ.get("HISTORY_DB") or (os.path.join(ASSESSMENT_STORE_DIR, "history.db") if ASSESSMENT_STORE_DIR else "assessment_history.db")
+)
+history_writer = ThreadPoolExecutor(max_workers=1)
+# Charts are drawn off the request on a thread pool and served from CHART_FOLDER.
+charts = chart_renderer.ChartRenderer(CHART_FOLDER, max_workers=int(os.environ.get("CHART_WORKERS", 2)))
+# Opt-in background assessments (form field "async"), run in a process pool.
+# The LCA model is loaded once, on a background thread as the app starts, and
+# kept in memory; set LCA_SERVICE=0 to leave environmental impact out. Job
+# workers, which import this module afresh, get the service with each job
+# instead of loading their own. Pages never wait for the load; only the
+# environmental scoring step does.
+def load_lca_service():
+    # The LCA service, or None when it cannot be loaded, e.g. without
+    # Brightway installed.
+    try:
+        return lca_service.LCAService()
+    except Exception:
+        return None
+
+lca_loader = ThreadPoolExecutor(max_workers=1)
+if os.environ.get("LCA_SERVICE", "1") != "0" and multiprocessing.parent_process() is None:
+    lca = lca_loader.submit(load_lca_service)
+else:
+    lca = Future()
+    lca.set_result(None)
+
+def environmental_service():
+    # The loaded LCA service (waiting for the load to finish), or None when it
+    # is disabled or could not be loaded.
+    return lca.result()
+
+def lca_status():
+    # "pending" while the service loads, then "ready" or "unavailable".
+    if not lca.done():
+        return "pending"
+    return "ready" if lca.result() is not None else "unavailable"
+
+jobs = job_runner.JobRunner(
+    max_workers=int(os.environ.get("ASYNC_WORKERS", 2)),
+    status_dir=os.path.join(ASSESSMENT_STORE_DIR, "jobs") if ASSESSMENT_STORE_DIR else None
+)
+
+def run_assessment(file_path, progress=None, wait_for_chart=False, previous=None, environmental=None):
+    # Parses and scores an upload and renders the comparison chart. Returns
+    # (entry, None) with everything that does not depend on the selected
+    # method, or (None, error message) when the file cannot be assessed.
+    # progress, if given, is called as progress(stage, fraction). The chart is
+    # drawn in the background unless wait_for_chart is set, in which case it is
+    # drawn in the calling thread, so a job worker returns only once its chart
+    # is on disk. previous is the entry of an earlier version of the register:
+    # rows it already scored are reused and entry["changes"] reports what
+    # moved. environmental returns the LCA service (or None); with it, whole
+    # registers also get environmental scores. It is only called, and so only
+    # waits for the service to load, once scoring reaches that step.
+    if progress is None:
+        progress = lambda stage, fraction: None
+    risk_app = RiskAssessmentApp()
+    streamed = None
+    changes = None
+    progress("reading file", 0.05)
+    if file_path.endswith(".xlsx"):
+        # Check the header before any data row is parsed.
+        risk_streaming.check_columns(risk_streaming.read_header(file_path), risk_app.get_required_columns())
+        if os.path.getsize(file_path) > app.config['STREAMING_THRESHOLD_BYTES']:
+            streamed = risk_app.stream_file(
+                file_path, app.config['STREAMING_CHUNK_SIZE'], app.config['STREAMING_TOP_K'],
+                on_chunk=lambda rows: progress(f"scoring ({rows} rows)", 0.3)
+            )
+
+    if streamed is None:
+        risk_app.df = pd.read_excel(file_path)
+        actual_columns = risk_app.df.columns.tolist()
+        required_columns = risk_app.get_required_columns()
+        if not all(col in actual_columns for col in required_columns):
+            missing_cols = [col for col in required_columns if col not in actual_columns]
+            return None, f"Excel file must contain the following columns: {', '.join(required_columns)}\nMissing columns: {', '.join(missing_cols)}"
+        risk_app.original_risk_names = risk_app.df["Risk Name"].tolist()
+        progress("scoring", 0.4)
+        rescored = None
+        if previous is not None and previous["df"] is not None:
+            rescored = register_diff.rescore(previous["df"], previous["results"], risk_app.df)
+        if rescored is not None:
+            risk_app.results, changes = rescored
+        else:
+            risk_app.results = risk_app.calculate_all()
+
+    all_errors = []
+    for m in risk_app.results:
+        df, errors = risk_app.results[m]
+        if df is None:
+            return None, f"No valid data to process for {m.upper()}. Please check your Excel file.\n" + "\n".join(errors)
+        all_errors.extend(errors)
+    if streamed is not None:
+        all_errors = streamed.all_errors()
+    elif environmental is not None:
+        progress("environmental impact", 0.6)
+        service = environmental()
+        if service is not None:
+            all_errors.extend(risk_app.add_environmental_impact(service))
+
+    progress("rendering chart", 0.7)
+    chart_name = None
+    if risk_app.results:
+        matrix = risk_app.combined_score_matrix()
+        chart_name = charts.render_combined(matrix) if wait_for_chart else charts.submit_combined(matrix)
+
+    return {
+        "df": risk_app.df,
+        "original_risk_names": risk_app.original_risk_names,
+        "results": risk_app.results,
+        "errors": all_errors,
+        "combined_chart": chart_name,
+        "streamed_top_k": streamed.top_k if streamed is not None else None,
+        "streamed_valid": streamed.valid_counts if streamed is not None else None,
+        "changes": changes,
+        "rollup": streamed.rollup.as_dict() if streamed is not None else task_rollup.build_rollup(risk_app.results),
+    }, None
+
+def assessment_job(file_path, previous, environmental, progress):
+    # Entry point for job_runner workers; the entry is pickled back to the
+    # web process, which caches it and stores the result. environmental is
+    # the web process's LCA service (or None), pickled without its Brightway
+    # engine.
+    return run_assessment(file_path, progress, wait_for_chart=True, previous=previous, environmental=lambda: environmental)
+
+def client_id():
+    # The requesting client's ID from CLIENT_COOKIE, or a new one that
+    # set_client_cookie sends back with the response.
+    if "client_id" not in g:
+        client = request.cookies.get(CLIENT_COOKIE)
+        if not assessment_store.is_valid_result_id(client):
+            client = g.new_client_id = assessment_store.new_result_id()
+        g.client_id = client
+    return g.client_id
+
+@app.context_processor
+def lca_context():
+    return {"lca_status": lca_status()}
+
+@app.after_request
+def set_client_cookie(response):
+    if "new_client_id" in g:
+        response.set_cookie(CLIENT_COOKIE, g.new_client_id, max_age=365 * 24 * 3600, httponly=True, samesite="Lax")
+    return response
+
+def register_version_key(client, file_name):
+    # Store keys are 32 hex digits, like result IDs.
+    return hashlib.sha256(f"{client}:{register_diff.name_key(file_name)}".encode("utf-8")).hexdigest()[:32]
+
+def previous_version(key, file_name, client, previous_result=None):
+    # The cached entry of the register's previous version: the result named
+    # by previous_result (lineage) if given, else this client's last upload
+    # under the same file name. None if there is none or it is no longer cached.
+    record = None
+    if previous_result:
+        record = results_store.get(previous_result)
+    if record is None:
+        record = register_versions.get(register_version_key(client, file_name))
+    if record is None or record["key"] == key:
+        return None
+    return upload_cache.get(record["key"])
+
+def save_upload(file):
+    # Copies the upload to UPLOAD_FOLDER block by block, hashing it on the way,
+    # and returns (content key, file path). The file is named by its key and
+    # written via rename, so concurrent uploads never read a half-written or
+    # foreign file, and the upload is never held in memory whole.
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{assessment_store.new_result_id()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            for block in iter(lambda: file.stream.read(UPLOAD_CHUNK_BYTES), b""):
+                digest.update(block)
+                f.write(block)
+        key = digest.hexdigest()
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], key + os.path.splitext(file.filename)[1])
+        if os.path.exists(file_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return key, file_path
+
+def record_history(entry, key, file_name):
+    history_writer.submit(history.record, entry["results"], key, file_name)
+
+def finish_job(job_id, future, key, method, file_name, client):
+    try:
+        entry, error = future.result()
+    except risk_streaming.MissingColumnsError as e:
+        entry, error = None, str(e)
+    except Exception as e:
+        entry, error = None, f"Failed to load file: {str(e)}"
+    if error:
+        jobs.set_status(job_id, "failed", stage="failed", progress=1.0, error=error)
+        return
+    upload_cache.put(key, entry)
+    register_versions.put(register_version_key(client, file_name), {"key": key})
+    record_history(entry, key, file_name)
+    result_id = assessment_store.new_result_id()
+    results_store.put(result_id, {"key": key, "method": method})
+    jobs.set_status(job_id, "done", stage="done", progress=1.0, result_id=result_id)
+
+def uncertainty_job(df, n_samples, seed, progress):
+    return risk_uncertainty.simulate(df, n_samples=n_samples, seed=seed, progress=progress)
+
+def finish_uncertainty_job(job_id, future, cache_key, result_id, n_samples, seed):
+    try:
+        simulated = future.result()
+    except Exception as e:
+        jobs.set_status(job_id, "failed", stage="failed", progress=1.0, error=f"Simulation failed: {str(e)}")
+        return
+    upload_cache.put(cache_key, simulated)
+    jobs.set_status(job_id, "done", stage="done", progress=1.0, result_id=result_id, kind="uncertainty", samples=n_samples, seed=seed)
+
+def render_results(entry, method, result_id):
+    results = entry["results"]
+    other_methods = [m for m in ["fmea", "risk matrix", "bow-tie"] if m != method]
+    other_df1 = results[other_methods[0]][0].head(3)
+    other_df2 = results[other_methods[1]][0].head(3)
+
+    # Only the first page of the selected method is rendered; the table pages,
+    # sorts and filters through /results/<id>/rows.
+    first_page, total, pages, _ = result_pages.get_page(entry, method, page_size=app.config['RESULTS_PAGE_SIZE'])
+    selected_html = first_page.to_html(index=False, classes="table table-striped", table_id="selected-table")
+    other_html1 = other_df1.to_html(index=False, classes="table table-striped")
+    other_html2 = other_df2.to_html(index=False, classes="table table-striped")
+    environmental_html = None
+    if risk_scoring.ENVIRONMENTAL in results:
+        environmental_html = results[risk_scoring.ENVIRONMENTAL][0].head(3).to_html(index=False, classes="table table-striped")
+
+    return render_template(
+        "results.html",
+        selected_table=selected_html,
+        other_table1=other_html1,
+        other_table2=other_html2,
+        method=method.upper(),
+        other_method1=other_methods[0].upper(),
+        other_method2=other_methods[1].upper(),
+        environmental_table=environmental_html,
+        errors=entry["errors"] if entry["errors"] else None,
+        combined_chart=url_for("chart", name=entry["combined_chart"]) if entry["combined_chart"] else None,
+        streamed_top_k=entry["streamed_top_k"],
+        streamed_valid=entry["streamed_valid"][method] if entry["streamed_valid"] else None,
+        result_id=result_id,
+        risk_count=len(entry["original_risk_names"]),
+        chart_page_size=chart_renderer.DEFAULT_TOP_N,
+        selected_method=method,
+        table_total=total,
+        table_pages=pages,
+        table_page_size=app.config['RESULTS_PAGE_SIZE'],
+        tasks=result_pages.task_values(entry, method),
+        has_ranges=entry["df"] is not None and risk_uncertainty.has_ranges(entry["df"]),
+        parquet_available=result_export.format_available("parquet"),
+        changes=entry.get("changes"),
+        rollup=entry["rollup"].get(method) if entry.get("rollup") else None,
+        rollup_tasks_shown=app.config['ROLLUP_TASKS_SHOWN']
+    )
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -188,70 +413,36 @@ def index():
             return render_template("index.html", error="No file selected.")
 
         if file and file.filename.endswith((".xlsx", ".xls")):
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(file_path)
-
             try:
-                risk_app.df = pd.read_excel(file_path)
-                actual_columns = risk_app.df.columns.tolist()
-                required_columns = risk_app.get_required_columns()
-                if not all(col in actual_columns for col in required_columns):
-                    missing_cols = [col for col in required_columns if col not in actual_columns]
-                    return render_template("index.html", error=f"Excel file must contain the following columns: {', '.join(required_columns)}\nMissing columns: {', '.join(missing_cols)}")
-                else:
-                    risk_app.original_risk_names = risk_app.df["Risk Name"].tolist()
-
-                    risk_app.results["fmea"] = risk_app.calculate_risk("fmea")
-                    risk_app.results["risk matrix"] = risk_app.calculate_risk("risk matrix")
-                    risk_app.results["bow-tie"] = risk_app.calculate_risk("bow-tie")
-
-                    all_errors = []
-                    for m in risk_app.results:
-                        df, errors = risk_app.results[m]
-                        if df is None:
-                            return render_template("index.html", error=f"No valid data to process for {m.upper()}. Please check your Excel file.\n" + "\n".join(errors))
-                        all_errors.extend(errors)
-
-                    selected_df = risk_app.results[method][0]
-                    other_methods = [m for m in ["fmea", "risk matrix", "bow-tie"] if m != method]
-                    other_df1 = risk_app.results[other_methods[0]][0].head(3)
-                    other_df2 = risk_app.results[other_methods[1]][0].head(3)
-
-                    selected_html = selected_df.to_html(index=False, classes="table table-striped")
-                    other_html1 = other_df1.to_html(index=False, classes="table table-striped")
-                    other_html2 = other_df2.to_html(index=False, classes="table table-striped")
-
-                    with open("risk_assessment_results.txt", "w", encoding="utf-8") as f:
-                        for m in risk_app.results:
-                            df, _ = risk_app.results[m]
-                            if m == method:
-                                f.write(f"{m.upper()} Results (All Risks):\n")
-                                f.write(df.to_string(index=False))
-                            else:
-                                f.write(f"\n\n{m.upper()} Top 3 Risks:\n")
-                                f.write(df.head(3).to_string(index=False))
-                            f.write("\n")
-
-                    combined_plot = risk_app.plot_combined_scores()
-                    if combined_plot:
-                        combined_plot.seek(0)
-                        plot_data = base64.b64encode(combined_plot.read()).decode("utf-8")
-                        combined_plot.close()
-                    else:
-                        plot_data = None
-
-                    return render_template(
-                        "results.html",
-                        selected_table=selected_html,
-                        other_table1=other_html1,
-                        other_table2=other_html2,
-                        method=method.upper(),
-                        other_method1=other_methods[0].upper(),
-                        other_method2=other_methods[1].upper(),
-                        errors=all_errors if all_errors else None,
-                        combined_plot=plot_data
-                    )
-
+                key, file_path = save_upload(file)
+                entry = upload_cache.get(key)
+                if entry is None:
+                    client = client_id()
+                    previous = previous_version(key, file.filename, client, request.form.get("previous_result"))
+                    if request.form.get("async"):
+                        # Queued until the LCA service has loaded, which it is passed.
+                        job_id = jobs.submit(
+                            assessment_job, (file_path, previous),
+                            lambda job_id, future: finish_job(job_id, future, key, method, file.filename, client),
+                            after=lca
+                        )
+                        if request.accept_mimetypes.best == "application/json":
+                            return jsonify({"job_id": job_id, "status_url": url_for("job_status", job_id=job_id)}), 202
+                        return render_template("job.html", job_id=job_id, method=method.upper())
+
+                    entry, error = run_assessment(file_path, previous=previous, environmental=environmental_service)
+                    if error:
+                        return render_template("index.html", error=error)
+                    upload_cache.put(key, entry)
+                    register_versions.put(register_version_key(client, file.filename), {"key": key})
+                    record_history(entry, key, file.filename)
+
+                result_id = assessment_store.new_result_id()
+                results_store.put(result_id, {"key": key, "method": method})
+                return render_results(entry, method, result_id)
+
+            except risk_streaming.MissingColumnsError as e:
+                return render_template("index.html", error=str(e))
             except Exception as e:
                 return render_template("index.html", error=f"Failed to load file: {str(e)}")
 
@@ -259,9 +450,297 @@ def index():
 
     return render_template("index.html")
 
-@app.route("/download_results")
-def download_results():
-    return send_file("risk_assessment_results.txt", as_attachment=True)
+def what_if_entry(result_id, entry, session):
+    # The cached entry as seen through a result's what-if edits, built once
+    # per session version.
+    key = f"what-if-{result_id}-{session.version}"
+    edited = upload_cache.get(key)
+    if edited is None:
+        results = session.results()
+        service = environmental_service() if risk_scoring.ENVIRONMENTAL in entry["results"] else None
+        if service is not None:
+            result, errors = service.score(session.df)
+            if result is not None:
+                results[risk_scoring.ENVIRONMENTAL] = (result, errors)
+        names = session.df["Risk Name"].tolist()
+        matrix = risk_scoring.align_scores(results, names, session.df.index)
+        edited = {
+            "df": session.df,
+            "original_risk_names": names,
+            "results": results,
+            "errors": [error for _, errors in results.values() for error in errors],
+            "combined_chart": charts.submit_combined(matrix),
+            "streamed_top_k": None,
+            "streamed_valid": None,
+            "rollup": task_rollup.build_rollup(results),
+            "what_if_version": session.version,
+        }
+        upload_cache.put(key, edited, write_disk=False)
+    return edited
+
+def load_result(result_id):
+    # Returns (record, entry) for a stored result, or (None, None) once either
+    # the record or the cached assessment behind it has expired. Results with
+    # what-if edits return the edited entry.
+    record = results_store.get(result_id)
+    if record is None:
+        return None, None
+    entry = upload_cache.get(record["key"])
+    if entry is None:
+        return None, None
+    session = what_if_sessions.get(result_id)
+    if session is not None:
+        entry = what_if_entry(result_id, entry, session)
+    return record, entry
+
+@app.route("/api/score", methods=["POST"])
+def api_score():
+    # Machine-to-machine scoring: CSV, JSON lines, Parquet or XLSX in (raw body
+    # or a multipart "file"), scored rows and structured errors out as JSON or,
+    # with ?format=arrow or an Arrow Accept header, as an Arrow IPC stream.
+    # ?methods=fmea,bow-tie limits the methods (default: all three).
+    try:
+        if "file" in request.files:
+            upload = request.files["file"]
+            data = upload.read()
+            fmt = score_api.detect_format(filename=upload.filename, explicit=request.args.get("input"))
+        else:
+            data = request.get_data()
+            fmt = score_api.detect_format(content_type=request.content_type, explicit=request.args.get("input"))
+        methods = score_api.parse_methods(request.args.get("methods") or request.form.get("methods"))
+        scored = score_api.score_frame(score_api.read_frame(data, fmt), methods)
+
+        output = request.args.get("format") or request.accept_mimetypes.best_match(["application/json", score_api.ARROW_MIMETYPE])
+        if output in ("arrow", score_api.ARROW_MIMETYPE):
+            return Response(score_api.to_arrow_ipc(scored), mimetype=score_api.ARROW_MIMETYPE)
+        return jsonify(score_api.to_json_payload(scored))
+    except score_api.ScoreApiError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": f"Failed to read input: {str(e)}"}), 400
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    status = jobs.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job ID."}), 404
+    status = dict(status)
+    if status.get("kind") == "uncertainty":
+        status["results_url"] = url_for("results_uncertainty", result_id=status["result_id"], samples=status["samples"], seed=status["seed"])
+    elif status.get("result_id"):
+        status["results_url"] = url_for("show_results", result_id=status["result_id"])
+    return jsonify(status)
+
+@app.route("/results/<result_id>")
+def show_results(result_id):
+    record, entry = load_result(result_id)
+    if record is None:
+        return render_template("index.html", error="These results are no longer available. Please upload the file again."), 404
+    return render_results(entry, record["method"], result_id)
+
+@app.route("/results/<result_id>/rows")
+def results_rows(result_id):
+    # One page of a result table as JSON: ?method=&page=&page_size=&sort=<column>
+    # &order=asc|desc&task=<Task Affected>&min_score=&max_score=
+    record, entry = load_result(result_id)
+    if record is None:
+        return jsonify({"error": "These results are no longer available."}), 404
+    method = request.args.get("method", record["method"]).lower()
+    if method not in entry["results"]:
+        return jsonify({"error": f"Unknown method: {method}"}), 400
+    page_size = request.args.get("page_size", app.config['RESULTS_PAGE_SIZE'], type=int)
+    try:
+        rows, total, pages, page = result_pages.get_page(
+            entry, method,
+            page=request.args.get("page", 1, type=int),
+            page_size=page_size,
+            sort=request.args.get("sort") or None,
+            ascending=request.args.get("order", "desc") == "asc",
+            task=request.args.get("task") or None,
+            min_score=request.args.get("min_score", type=float),
+            max_score=request.args.get("max_score", type=float)
+        )
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result_pages.page_payload(rows, total, pages, page, min(max(page_size, 1), result_pages.MAX_PAGE_SIZE)))
+
+@app.route("/results/<result_id>/rollup")
+def results_rollup(result_id):
+    # Precomputed per-task and per-band aggregates: ?method=&task=&band=.
+    # Without task or band the method's whole cube is returned.
+    record, entry = load_result(result_id)
+    if record is None:
+        return jsonify({"error": "These results are no longer available."}), 404
+    method = request.args.get("method", record["method"]).lower()
+    if not entry.get("rollup") or method not in entry["rollup"]:
+        return jsonify({"error": f"Unknown method: {method}"}), 400
+    cube = entry["rollup"][method]
+    task = request.args.get("task") or None
+    band = request.args.get("band") or None
+    if band is not None and band not in cube["bands"]:
+        return jsonify({"error": f"Unknown band: {band}. Use one of: {', '.join(cube['bands'])}"}), 400
+    if task is None:
+        if band is None:
+            return jsonify({"method": method, **cube})
+        return jsonify({"method": method, "band": band, **cube["by_band"][band]})
+    row = next((row for row in cube["tasks"] if row["task"] == task), None)
+    if row is None:
+        return jsonify({"error": f"Unknown task: {task}"}), 404
+    if band is None:
+        return jsonify({"method": method, **row})
+    empty = {"count": 0, "sum": 0.0, "max": None, "mean": None, "top": []}
+    return jsonify({"method": method, "task": task, "band": band, **row["bands"].get(band, empty)})
+
+@app.route("/results/<result_id>/uncertainty")
+def results_uncertainty(result_id):
+    # Monte Carlo scores from the "<column> Min"/"<column> Max" ranges of the
+    # register: ?samples=10000&seed=0. Small runs are answered directly; large
+    # ones return 202 with a job status URL whose results_url points back here.
+    record, entry = load_result(result_id)
+    if record is None:
+        return jsonify({"error": "These results are no longer available."}), 404
+    if entry["df"] is None:
+        return jsonify({"error": "Uncertainty mode needs the whole register; it is not available for streamed uploads."}), 400
+    n_samples = min(max(request.args.get("samples", risk_uncertainty.DEFAULT_SAMPLES, type=int), 1), app.config['UNCERTAINTY_MAX_SAMPLES'])
+    seed = request.args.get("seed", risk_uncertainty.DEFAULT_SEED, type=int)
+    cache_key = f"{record['key']}-{entry.get('what_if_version', 0)}-uncertainty-{n_samples}-{seed}"
+
+    simulated = upload_cache.get(cache_key)
+    if simulated is None:
+        if n_samples * len(entry["df"]) > app.config['UNCERTAINTY_SYNC_DRAWS']:
+            job_id = jobs.submit(
+                uncertainty_job, (entry["df"], n_samples, seed),
+                lambda job_id, future: finish_uncertainty_job(job_id, future, cache_key, result_id, n_samples, seed)
+            )
+            return jsonify({"job_id": job_id, "status_url": url_for("job_status", job_id=job_id)}), 202
+        simulated = risk_uncertainty.simulate(entry["df"], n_samples=n_samples, seed=seed)
+        upload_cache.put(cache_key, simulated)
+
+    payload = {"samples": n_samples, "seed": seed, "rank_samples": min(n_samples, risk_uncertainty.RANK_SAMPLES), "methods": {}}
+    for method, (df, errors) in simulated.items():
+        payload["methods"][method] = {
+            "rows": [] if df is None else score_api.json_records(df),
+            "errors": errors,
+        }
+    return jsonify(payload)
+
+@app.route("/results/<result_id>/what-if", methods=["POST"])
+def results_what_if(result_id):
+    # Applies cell edits to a result and re-ranks only the edited rows:
+    # {"edits": [{"row": 12, "column": "Detection", "value": 3}, ...], "top": 3}.
+    # Later views of the result (page, rows, chart, downloads) show the edits.
+    record, entry = load_result(result_id)
+    if record is None:
+        return jsonify({"error": "These results are no longer available."}), 404
+    if entry["df"] is None:
+        return jsonify({"error": "What-if edits need the whole register; they are not available for streamed uploads."}), 400
+    body = request.get_json(silent=True) or {}
+    edits = body.get("edits")
+    if not isinstance(edits, list) or not all(isinstance(edit, dict) for edit in edits):
+        return jsonify({"error": 'Send {"edits": [{"row": ..., "column": ..., "value": ...}]}.'}), 400
+    try:
+        top_n = min(max(int(body.get("top", 3)), 1), result_pages.MAX_PAGE_SIZE)
+    except (ValueError, TypeError):
+        return jsonify({"error": f"top must be a whole number, got {body.get('top')!r}."}), 400
+
+    with what_if_lock(result_id):
+        session = what_if_sessions.get(result_id)
+        if session is None:
+            session = what_if.WhatIfSession(entry["df"])
+        try:
+            changes = session.apply(edits)
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+        what_if_sessions.put(result_id, session)
+
+    return jsonify({
+        "version": session.version,
+        "changes": changes,
+        "top": {method: score_api.json_records(session.top(method, top_n)) for method in session.methods},
+        "results_url": url_for("show_results", result_id=result_id),
+    })
+
+@app.route("/results/<result_id>/chart")
+def results_chart(result_id):
+    # Other views of the comparison chart: ?view=top&n=50, ?view=page&page=2
+    # or ?view=density. Each view is rendered once and then served as a file.
+    record, entry = load_result(result_id)
+    if record is None:
+        return "These results are no longer available.", 404
+    view = request.args.get("view", "auto")
+    if view not in ("auto", "all", "top", "page", "density"):
+        return "Unknown chart view.", 400
+    size = min(max(request.args.get("n", chart_renderer.DEFAULT_TOP_N, type=int), 1), chart_renderer.MAX_LABELED_RISKS)
+    page = max(request.args.get("page", 1, type=int), 1) - 1
+    row_index = entry["df"].index if entry["df"] is not None else None
+    matrix = risk_scoring.align_scores(entry["results"], entry["original_risk_names"], row_index)
+    name = charts.submit_combined(matrix, view=view, top_n=size, page=page, page_size=size)
+    return redirect(url_for("chart", name=name))
+
+@app.route("/charts/<name>")
+def chart(name):
+    if not chart_renderer.CHART_NAME_PATTERN.match(name):
+        return "Chart not found.", 404
+    if not charts.wait(name):
+        # The render may belong to another worker, or still be running here;
+        # either way the file appears under this name once it is written.
+        return "The chart is still being drawn. Try again shortly.", 503, {"Retry-After": str(CHART_RETRY_SECONDS)}
+    # Names are content hashes, so the file behind a URL never changes.
+    response = send_from_directory(CHART_FOLDER, name, max_age=31536000)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+@app.route("/download_results/<result_id>")
+def download_results(result_id):
+    # ?format=txt (default, the original report), csv, jsonl, xlsx or parquet.
+    # The export is generated chunk by chunk while the response streams.
+    fmt = request.args.get("format", "txt").lower()
+    if fmt not in result_export.EXPORT_FORMATS:
+        return render_template("index.html", error=f"Unknown export format: {fmt}"), 400
+    record, entry = load_result(result_id)
+    if record is None:
+        return render_template("index.html", error="These results are no longer available. Please upload the file again."), 404
+    mimetype, extension = result_export.EXPORT_FORMATS[fmt]
+    try:
+        chunks = result_export.iter_export(entry["results"], record["method"], fmt)
+    except ImportError as e:
+        return render_template("index.html", error=f"{fmt} export is not available on this server: {str(e)}"), 406
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=risk_assessment_results.{extension}"}
+    )
+
+@app.route("/history/assessments")
+def history_assessments():
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 1000)
+    return jsonify({"assessments": history.assessments(limit)})
+
+@app.route("/history/risks/<path:risk_name>")
+def history_risk(risk_name):
+    # Score and rank of one risk over its latest assessments:
+    # ?method=fmea&limit=50, newest first.
+    method = request.args.get("method", "fmea").lower()
+    if method not in risk_scoring.METHOD_SPECS:
+        return jsonify({"error": f"Unknown method: {method}"}), 400
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 1000)
+    return jsonify({"risk_name": risk_name, "method": method, "history": history.risk_trend(risk_name, method, limit)})
+
+@app.route("/history/top")
+def history_top():
+    # Top risks per Task Affected over a period: ?method=fmea&n=10&task=
+    # &since=&until= (Unix seconds or ISO dates; default: this quarter).
+    method = request.args.get("method", "fmea").lower()
+    if method not in risk_scoring.METHOD_SPECS:
+        return jsonify({"error": f"Unknown method: {method}"}), 400
+    try:
+        since = assessment_history.parse_time(request.args.get("since"))
+        until = assessment_history.parse_time(request.args.get("until"))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date: {str(e)}"}), 400
+    n = min(max(request.args.get("n", 10, type=int), 1), 1000)
+    tasks = history.top_by_task(method, since, until, n, request.args.get("task") or None)
+    return jsonify({"method": method, "tasks": tasks})
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -1,8 +1,33 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+from tkinter import filedialog, messagebox, simpledialog, ttk
+import multiprocessing
 import os
+import queue
+import shutil
+import threading
+
+import assessment_history
+import chart_renderer
+import job_runner
+import results_grid
+import risk_scoring
+import risk_streaming
+import what_if
+
+# How often the Tk loop checks the worker thread for progress, in ms.
+POLL_MS = 100
+
+# Charts offered after an analysis: label -> (chart kind, method, file
+# written next to the results). Kinds other than "combined" are
+# chart_renderer.METHOD_CHARTS.
+CHART_FILES = {"Combined Risk Scores": ("combined", None, "combined_risk_scores.png")}
+CHART_FILES.update({f"{method.upper()} Risk Matrix": ("matrix", method, f"risk_matrix_{method}.png") for method in risk_scoring.METHODS})
+CHART_FILES.update({f"{method.upper()} Score Bar": ("bar", method, f"score_bar_{method}.png") for method in risk_scoring.METHODS})
+CHART_FILES.update({f"{method.upper()} Risk Heatmap": ("heatmap", method, f"risk_heatmap_{method}.png") for method in risk_scoring.METHODS})
+
+class TaskCancelled(Exception):
+    pass
 
 class MethodSelectionWindow:
     def __init__(self, root):
@@ -51,25 +76,38 @@ class RiskAssessmentApp:
         self.run_button = tk.Button(root, text="Run Analysis", command=self.run_analysis, state=tk.DISABLED)
         self.run_button.pack(pady=5)
 
-        self.tree_frame = tk.Frame(root)
-        self.tree_frame.pack(pady=10, fill=tk.BOTH, expand=True)
+        self.what_if_button = tk.Button(root, text="What-If Edit", command=self.edit_cell, state=tk.DISABLED)
+        self.what_if_button.pack(pady=5)
 
-        self.tree_scroll_y = tk.Scrollbar(self.tree_frame, orient=tk.VERTICAL)
-        self.tree_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
+        # Charts are drawn when asked for, not with every analysis.
+        self.chart_frame = tk.Frame(root)
+        self.chart_frame.pack(pady=5)
 
-        self.tree_scroll_x = tk.Scrollbar(self.tree_frame, orient=tk.HORIZONTAL)
-        self.tree_scroll_x.pack(side=tk.BOTTOM, fill=tk.X)
+        self.chart_choice = ttk.Combobox(self.chart_frame, values=list(CHART_FILES), state="readonly", width=30)
+        self.chart_choice.current(0)
+        self.chart_choice.pack(side=tk.LEFT, padx=5)
 
-        self.tree = ttk.Treeview(
-            self.tree_frame,
-            yscrollcommand=self.tree_scroll_y.set,
-            xscrollcommand=self.tree_scroll_x.set,
-            height=10
-        )
-        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.show_chart_button = tk.Button(self.chart_frame, text="Show Chart", command=self.show_chart, state=tk.DISABLED)
+        self.show_chart_button.pack(side=tk.LEFT, padx=5)
+
+        self.save_charts_button = tk.Button(self.chart_frame, text="Save All Charts", command=self.save_all_charts, state=tk.DISABLED)
+        self.save_charts_button.pack(side=tk.LEFT, padx=5)
+
+        # Long work runs on a worker thread; its stage is shown here.
+        self.progress_frame = tk.Frame(root)
+        self.progress_frame.pack(pady=5, fill=tk.X)
 
-        self.tree_scroll_y.config(command=self.tree.yview)
-        self.tree_scroll_x.config(command=self.tree.xview)
+        self.progress_bar = ttk.Progressbar(self.progress_frame, orient=tk.HORIZONTAL, mode="determinate", maximum=100)
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
+
+        self.cancel_button = tk.Button(self.progress_frame, text="Cancel", command=self.cancel_task, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=10)
+
+        self.tree_frame = tk.Frame(root)
+        self.tree_frame.pack(pady=10, fill=tk.BOTH, expand=True)
+
+        # Only the visible rows exist as Treeview items; see results_grid.
+        self.grid = results_grid.VirtualGrid(self.tree_frame, height=10)
 
         self.other_methods = ["fmea", "risk matrix", "bow-tie"]
         self.other_methods.remove(self.method)
@@ -105,6 +143,24 @@ class RiskAssessmentApp:
         self.original_risk_names = None
         self.required_columns = self.get_required_columns()
         self.results = {}
+        self.what_if = None
+        self.file_path = None
+        self.history = assessment_history.HistoryStore(os.environ.get("HISTORY_DB", "assessment_history.db"))
+        self.tasks = queue.Queue()
+        self.task = None
+        self.task_done = None
+        self.task_failure = None
+        self.cancel_event = threading.Event()
+        # Content-hashed chart cache shared across analyses; unchanged results
+        # are never redrawn. Saving all charts renders them in parallel, in
+        # worker processes started the way job_runner starts its own rather
+        # than forked from this threaded Tk process.
+        self.charts = chart_renderer.ChartRenderer(
+            os.environ.get("CHART_FOLDER", "charts"),
+            max_workers=int(os.environ.get("CHART_WORKERS", os.cpu_count() or 2)),
+            processes=True,
+            mp_context=multiprocessing.get_context(job_runner.START_METHOD)
+        )
 
     def show_method_instructions(self):
         messagebox.showinfo(
@@ -124,244 +180,242 @@ class RiskAssessmentApp:
         )
 
     def get_required_columns(self):
-        return [
-            "Risk Name",
-            "Probability (%)",
-            "Impact (Severity)",
-            "Detection",
-            "Probability",
-            "Impact",
-            "Cause Likelihood",
-            "Consequence Severity",
-            "Barrier Effectiveness",
-            "Task Affected"
-        ]
+        return list(risk_scoring.REQUIRED_COLUMNS)
 
     def get_result_columns(self, method):
-        if method == "fmea":
-            return ["Risk Name", "Probability (%)", "Impact (Severity)", "Detection", "Task Affected", "RPN"]
-        elif method == "risk matrix":
-            return ["Risk Name", "Probability", "Impact", "Task Affected", "Risk Score"]
-        elif method == "bow-tie":
-            return ["Risk Name", "Cause Likelihood", "Consequence Severity", "Barrier Effectiveness", "Task Affected", "Barrier Score"]
+        return risk_scoring.get_result_columns(method)
 
     def load_file(self):
         file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx *.xls")])
         if file_path:
+            self.df = None
+            self.results = {}
+            self.what_if = None
+            self.run_button.config(state=tk.DISABLED)
+            self.what_if_button.config(state=tk.DISABLED)
+            self.show_chart_button.config(state=tk.DISABLED)
+            self.save_charts_button.config(state=tk.DISABLED)
+            self.start_task(
+                lambda progress: self.read_register(file_path, progress),
+                lambda loaded: self.show_loaded(file_path, loaded),
+                "Failed to load file"
+            )
+
+    def read_register(self, file_path, progress):
+        # Worker thread. Returns (df, missing columns); df is None when
+        # required columns are missing.
+        progress("Checking columns...", 0.1)
+        df = None
+        if file_path.endswith(".xlsx"):
+            # Check the header before parsing any data rows
+            actual_columns = risk_streaming.read_header(file_path)
+        else:
+            df = pd.read_excel(file_path)
+            actual_columns = df.columns.tolist()
+        missing_cols = [col for col in self.required_columns if col not in actual_columns]
+        if missing_cols:
+            return None, missing_cols
+        if df is None:
+            progress("Reading file...", 0.3)
+            df = pd.read_excel(file_path)
+        return df, []
+
+    def show_loaded(self, file_path, loaded):
+        df, missing_cols = loaded
+        if missing_cols:
+            messagebox.showerror("Error", f"Excel file must contain columns: {', '.join(self.required_columns)}\nMissing columns: {', '.join(missing_cols)}")
+            return
+        self.df = df
+        self.original_risk_names = self.df["Risk Name"].tolist()  # Store original order of risk names
+        self.file_path = file_path
+        self.status_label.config(text=f"Loaded file: {os.path.basename(file_path)}\nClick 'Run Analysis' to proceed.")
+        self.run_button.config(state=tk.NORMAL)
+
+    def start_task(self, fn, on_done, failure):
+        # Runs fn(progress) on a worker thread and hands its result to
+        # on_done on the Tk thread; an exception is shown as "failure: ...".
+        # One task at a time; the buttons that start work are disabled meanwhile.
+        if self.task is not None:
+            return
+        self.cancel_event.clear()
+        self.task_done = on_done
+        self.task_failure = failure
+        self.set_busy(True)
+        self.task = threading.Thread(target=self.run_task, args=(fn,), daemon=True)
+        self.task.start()
+        self.root.after(POLL_MS, self.poll_tasks)
+
+    def run_task(self, fn):
+        try:
+            self.tasks.put(("done", fn(self.report_progress)))
+        except TaskCancelled:
+            self.tasks.put(("cancelled", None))
+        except Exception as e:
+            self.tasks.put(("error", e))
+
+    def report_progress(self, stage, fraction):
+        # Called by the worker between steps, which is also where a cancel
+        # request takes effect.
+        if self.cancel_event.is_set():
+            raise TaskCancelled()
+        self.tasks.put(("progress", (stage, fraction)))
+
+    def poll_tasks(self):
+        while True:
             try:
-                self.df = pd.read_excel(file_path)
-                actual_columns = self.df.columns.tolist()
-                if not all(col in actual_columns for col in self.required_columns):
-                    missing_cols = [col for col in self.required_columns if col not in actual_columns]
-                    messagebox.showerror("Error", f"Excel file must contain columns: {', '.join(self.required_columns)}\nMissing columns: {', '.join(missing_cols)}")
-                    self.df = None
-                    self.run_button.config(state=tk.DISABLED)
-                else:
-                    self.original_risk_names = self.df["Risk Name"].tolist()  # Store original order of risk names
-                    self.status_label.config(text=f"Loaded file: {os.path.basename(file_path)}\nClick 'Run Analysis' to proceed.")
-                    self.run_button.config(state=tk.NORMAL)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load file: {str(e)}")
-                self.df = None
-                self.run_button.config(state=tk.DISABLED)
+                kind, payload = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                stage, fraction = payload
+                self.progress_bar["value"] = 100 * fraction
+                self.status_label.config(text=stage)
+                continue
+            self.task = None
+            self.progress_bar["value"] = 0
+            self.set_busy(False)
+            if kind == "done":
+                self.task_done(payload)
+            elif kind == "cancelled":
+                self.status_label.config(text="Cancelled.")
+            else:
+                self.status_label.config(text="")
+                messagebox.showerror("Error", f"{self.task_failure}: {str(payload)}")
+            return
+        self.root.after(POLL_MS, self.poll_tasks)
+
+    def cancel_task(self):
+        if self.task is not None:
+            self.cancel_event.set()
+            self.status_label.config(text="Cancelling...")
+
+    def set_busy(self, busy):
+        self.select_button.config(state=tk.DISABLED if busy else tk.NORMAL)
+        self.run_button.config(state=tk.DISABLED if busy or self.df is None else tk.NORMAL)
+        results_state = tk.DISABLED if busy or not self.results else tk.NORMAL
+        self.what_if_button.config(state=results_state)
+        self.show_chart_button.config(state=results_state)
+        self.save_charts_button.config(state=results_state)
+        self.cancel_button.config(state=tk.NORMAL if busy else tk.DISABLED)
 
     def calculate_risk(self, method):
-        valid_rows = []
-        errors = []
-        for idx, row in self.df.iterrows():
-            try:
-                risk_name = str(row["Risk Name"])
-                task_affected = str(row["Task Affected"])
-                if pd.isna(risk_name) or pd.isna(task_affected):
-                    errors.append(f"Row {idx + 2}: Missing or invalid Risk Name or Task Affected ({method.upper()})")
-                    continue
-
-                if method == "fmea":
-                    prob = float(row["Probability (%)"])
-                    impact = float(row["Impact (Severity)"])
-                    detection = float(row["Detection"])
-                    if pd.isna(prob) or pd.isna(impact) or pd.isna(detection):
-                        errors.append(f"Row {idx + 2}: Missing or invalid data in one of the columns (FMEA)")
-                        continue
-                    if not (0 <= prob <= 100):
-                        errors.append(f"Row {idx + 2}: Probability (%) must be between 0 and 100, got {prob} (FMEA)")
-                        continue
-                    if not (1 <= impact <= 10):
-                        errors.append(f"Row {idx + 2}: Impact (Severity) must be between 1 and 10, got {impact} (FMEA)")
-                        continue
-                    if not (1 <= detection <= 10):
-                        errors.append(f"Row {idx + 2}: Detection must be between 1 and 10, got {detection} (FMEA)")
-                        continue
-                    score = (prob / 100) * impact * detection
-                    row["RPN"] = score
-                    valid_rows.append(row)
-
-                elif method == "risk matrix":
-                    prob = float(row["Probability"])
-                    impact = float(row["Impact"])
-                    if pd.isna(prob) or pd.isna(impact):
-                        errors.append(f"Row {idx + 2}: Missing or invalid data in one of the columns (Risk Matrix)")
-                        continue
-                    if not (1 <= prob <= 5):
-                        errors.append(f"Row {idx + 2}: Probability must be between 1 and 5, got {prob} (Risk Matrix)")
-                        continue
-                    if not (1 <= impact <= 5):
-                        errors.append(f"Row {idx + 2}: Impact must be between 1 and 5, got {impact} (Risk Matrix)")
-                        continue
-                    score = prob * impact
-                    row["Risk Score"] = score
-                    valid_rows.append(row)
-
-                elif method == "bow-tie":
-                    cause_likelihood = float(row["Cause Likelihood"])
-                    consequence_severity = float(row["Consequence Severity"])
-                    barrier_effectiveness = float(row["Barrier Effectiveness"])
-                    if pd.isna(cause_likelihood) or pd.isna(consequence_severity) or pd.isna(barrier_effectiveness):
-                        errors.append(f"Row {idx + 2}: Missing or invalid data in one of the columns (Bow-Tie)")
-                        continue
-                    if not (1 <= cause_likelihood <= 5):
-                        errors.append(f"Row {idx + 2}: Cause Likelihood must be between 1 and 5, got {cause_likelihood} (Bow-Tie)")
-                        continue
-                    if not (1 <= consequence_severity <= 5):
-                        errors.append(f"Row {idx + 2}: Consequence Severity must be between 1 and 5, got {consequence_severity} (Bow-Tie)")
-                        continue
-                    if not (1 <= barrier_effectiveness <= 5):
-                        errors.append(f"Row {idx + 2}: Barrier Effectiveness must be between 1 and 5, got {barrier_effectiveness} (Bow-Tie)")
-                        continue
-                    score = (cause_likelihood * consequence_severity) / barrier_effectiveness
-                    row["Barrier Score"] = score
-                    valid_rows.append(row)
-
-            except (ValueError, TypeError) as e:
-                errors.append(f"Row {idx + 2}: Invalid data - {str(e)} ({method.upper()})")
-
-        if not valid_rows:
-            return None, errors
-        df = pd.DataFrame(valid_rows)
-        score_column = "RPN" if method == "fmea" else "Risk Score" if method == "risk matrix" else "Barrier Score"
-        df = df.sort_values(by=score_column, ascending=False)
-        return df, errors
+        return risk_scoring.calculate_risk(self.df, method)
+
+    def calculate_all(self):
+        return risk_scoring.score_methods(self.df)
 
     def run_analysis(self):
         if self.df is None:
             messagebox.showerror("Error", "No data loaded. Please select an Excel file.")
             return
 
-        self.results["fmea"] = self.calculate_risk("fmea")
-        self.results["risk matrix"] = self.calculate_risk("risk matrix")
-        self.results["bow-tie"] = self.calculate_risk("bow-tie")
+        self.what_if = None
+        self.clear_results()
+        self.start_task(self.analyze, self.display_results, "Analysis failed")
 
-        self.display_results()
+    def clear_results(self):
+        # Until an analysis succeeds there are no results, so set_busy keeps
+        # the chart and what-if buttons disabled and no stale rows are shown.
+        self.results = {}
+        self.grid.show(None, self.method)
+        self.fill_tree(self.top_risks_tree1, None, self.other_methods[0])
+        self.fill_tree(self.top_risks_tree2, None, self.other_methods[1])
 
-    def normalize_score(self, score, method):
-        if method == "fmea":
-            return score  # Already in range 0 to 100
-        elif method == "risk matrix":
-            # Risk Score range: 1 to 25, map to 0 to 100
-            return ((score - 1) / (25 - 1)) * 100
-        elif method == "bow-tie":
-            # Barrier Score range: 0.2 to 25, map to 0 to 100
-            return ((score - 0.2) / (25 - 0.2)) * 100
-        return score
-
-    def plot_combined_scores(self):
-        if not self.results:
-            return
+    def analyze(self, progress):
+        # Worker thread: scoring, the history record, the text report and the
+        # grid's sort orders. Only display_results touches the widgets.
+        progress("Scoring risks...", 0.05)
+        results = self.calculate_all()
 
-        plt.figure(figsize=(12, 8))
-        risk_names = self.original_risk_names  # Use original order from Excel
-        y_positions = range(len(risk_names))
-
-        # Collect scores for each method
-        scores = {"fmea": [], "risk matrix": [], "bow-tie": []}
-        for risk in risk_names:
-            for method in self.results:
-                df, _ = self.results[method]
-                score_column = "RPN" if method == "fmea" else "Risk Score" if method == "risk matrix" else "Barrier Score"
-                score = df[df["Risk Name"] == risk][score_column].values
-                normalized_score = self.normalize_score(score[0] if len(score) > 0 else 0, method)
-                scores[method].append(normalized_score)
-
-        # Plot scores for each method with different colors
-        plt.scatter(scores["fmea"], y_positions, color="red", label="FMEA (RPN)", s=100)
-        plt.scatter(scores["risk matrix"], y_positions, color="green", label="Risk Matrix (Risk Score)", s=100)
-        plt.scatter(scores["bow-tie"], y_positions, color="blue", label="Bow-Tie (Barrier Score)", s=100)
-
-        # Draw lines connecting scores for each risk
-        for i in range(len(risk_names)):
-            # FMEA to Risk Matrix
-            plt.plot([scores["fmea"][i], scores["risk matrix"][i]], [i, i], color="gray", linestyle="--", alpha=0.5)
-            # Risk Matrix to Bow-Tie
-            plt.plot([scores["risk matrix"][i], scores["bow-tie"][i]], [i, i], color="gray", linestyle="--", alpha=0.5)
-            # Bow-Tie to FMEA (optional, to close the loop)
-            plt.plot([scores["bow-tie"][i], scores["fmea"][i]], [i, i], color="gray", linestyle="--", alpha=0.5)
-
-        # Set y-axis labels (risk names)
-        plt.yticks(y_positions, risk_names)
-        plt.xlabel("Normalized Score (0 to 100)")
-        plt.ylabel("Risk Name")
-        plt.title("Comparison of Risk Scores Across Methods")
-        plt.xlim(0, 100)  # Set x-axis range to 0 to 100
-        plt.legend()
-        plt.grid(True, which="both", linestyle="--", alpha=0.7)
-        plt.tight_layout()
-        plt.savefig("combined_risk_scores.png")
-        plt.close()
-
-    def display_results(self):
+        analysis = {"results": results, "failed": None}
         all_errors = []
-        for method in self.results:
-            df, errors = self.results[method]
+        for method in results:
+            df, errors = results[method]
             if df is None:
-                messagebox.showerror("Error", f"No valid data to process for {method.upper()}. Check your Excel file.\n" + "\n".join(errors))
-                return
+                analysis["failed"] = method
+                return analysis
             all_errors.extend(errors)
 
-        selected_df = self.results[self.method][0]
-        self.tree.delete(*self.tree.get_children())
-        self.tree["columns"] = self.get_result_columns(self.method)
-        self.tree.heading("#0", text="")
-        for col in self.tree["columns"]:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=120, anchor="center")
-
-        for idx, row in selected_df.iterrows():
-            values = [row[col] for col in self.get_result_columns(self.method)[:-1]]
-            score_column = self.get_result_columns(self.method)[-1]
-            values.append(f"{row[score_column]:.2f}")
-            self.tree.insert("", tk.END, values=values)
-
-        other_df1 = self.results[self.other_methods[0]][0].head(3)
-        self.top_risks_tree1.delete(*self.top_risks_tree1.get_children())
-        self.top_risks_tree1["columns"] = self.get_result_columns(self.other_methods[0])
-        self.top_risks_tree1.heading("#0", text="")
-        for col in self.top_risks_tree1["columns"]:
-            self.top_risks_tree1.heading(col, text=col)
-            self.top_risks_tree1.column(col, width=120, anchor="center")
-
-        for idx, row in other_df1.iterrows():
-            values = [row[col] for col in self.get_result_columns(self.other_methods[0])[:-1]]
-            score_column = self.get_result_columns(self.other_methods[0])[-1]
-            values.append(f"{row[score_column]:.2f}")
-            self.top_risks_tree1.insert("", tk.END, values=values)
-
-        other_df2 = self.results[self.other_methods[1]][0].head(3)
-        self.top_risks_tree2.delete(*self.top_risks_tree2.get_children())
-        self.top_risks_tree2["columns"] = self.get_result_columns(self.other_methods[1])
-        self.top_risks_tree2.heading("#0", text="")
-        for col in self.top_risks_tree2["columns"]:
-            self.top_risks_tree2.heading(col, text=col)
-            self.top_risks_tree2.column(col, width=120, anchor="center")
-
-        for idx, row in other_df2.iterrows():
-            values = [row[col] for col in self.get_result_columns(self.other_methods[1])[:-1]]
-            score_column = self.get_result_columns(self.other_methods[1])[-1]
-            values.append(f"{row[score_column]:.2f}")
-            self.top_risks_tree2.insert("", tk.END, values=values)
+        progress("Recording history...", 0.3)
+        self.history.record(results, file_name=os.path.basename(self.file_path) if self.file_path else None)
+
+        progress("Writing report...", 0.4)
+        self.write_report(results, all_errors)
+        progress("Sorting results...", 0.6)
+        analysis["orders"] = results_grid.precompute_orders(results[self.method][0], self.method)
+        analysis["errors"] = all_errors
+        return analysis
+
+    def apply_edits(self, edits):
+        # Applies [{"row", "column", "value"}] cell edits, rescoring only the
+        # edited rows, and refreshes the tables. Returns the change records
+        # from what_if.WhatIfSession.apply.
+        if self.what_if is None:
+            self.what_if = what_if.WhatIfSession(self.df)
+        changes = self.what_if.apply(edits)
+        self.df = self.what_if.df
+        self.original_risk_names = self.df["Risk Name"].tolist()
+        self.results = self.what_if.results()
+        self.grid.show(self.results[self.method][0], self.method, keep_view=True)
+        self.fill_tree(self.top_risks_tree1, self.what_if.top(self.other_methods[0]), self.other_methods[0])
+        self.fill_tree(self.top_risks_tree2, self.what_if.top(self.other_methods[1]), self.other_methods[1])
+        return changes
+
+    def edit_cell(self):
+        row = simpledialog.askinteger("What-If Edit", "Spreadsheet row to change (first data row is 2):", parent=self.root, minvalue=2)
+        if row is None:
+            return
+        column = simpledialog.askstring("What-If Edit", "Column to change (e.g. Detection):", parent=self.root)
+        if not column:
+            return
+        value = simpledialog.askstring("What-If Edit", f"New value for {column} in row {row}:", parent=self.root)
+        if value is None:
+            return
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+        try:
+            changes = self.apply_edits([{"row": row, "column": column, "value": value}])
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        lines = []
+        for change in changes:
+            if change["error"]:
+                lines.append(change["error"])
+            else:
+                lines.append(f"{change['method'].upper()}: {change['risk']} {change['old_score']} -> {change['new_score']:.2f}, rank {change['old_rank']} -> {change['new_rank']}")
+        df, errors = self.results[self.method]
+        if df is None:
+            lines.append(f"No valid data to process for {self.method.upper()}.\n" + "\n".join(errors))
+        self.status_label.config(text="\n".join(lines) or f"Row {row} updated.")
 
+    def normalize_score(self, score, method):
+        return risk_scoring.normalize_score(score, method)
+
+    def combined_score_matrix(self, results=None):
+        row_index = self.df.index if self.df is not None else None
+        return risk_scoring.align_scores(self.results if results is None else results, self.original_risk_names, row_index)
+
+    def fill_tree(self, tree, df, method):
+        tree.delete(*tree.get_children())
+        tree["columns"] = self.get_result_columns(method)
+        tree.heading("#0", text="")
+        for col in tree["columns"]:
+            tree.heading(col, text=col)
+            tree.column(col, width=120, anchor="center")
+        if df is None:
+            return
+
+        columns = self.get_result_columns(method)
+        for row in df[columns].itertuples(index=False, name=None):
+            tree.insert("", tk.END, values=list(row[:-1]) + [f"{row[-1]:.2f}"])
+
+    def write_report(self, results, all_errors):
         with open("risk_assessment_results.txt", "w", encoding="utf-8") as f:
-            for method in self.results:
-                df, _ = self.results[method]
+            for method in results:
+                df, _ = results[method]
                 if method == self.method:
                     f.write(f"{method.upper()} Results (All Risks):\n")
                     f.write(df.to_string(index=False))
@@ -369,51 +423,75 @@ class RiskAssessmentApp:
                     f.write(f"\n\n{method.upper()} Top 3 Risks:\n")
                     f.write(df.head(3).to_string(index=False))
                 f.write("\n")
-
-        if all_errors:
-            self.status_label.config(text="Errors encountered:\n" + "\n".join(all_errors))
-            with open("risk_assessment_results.txt", "a", encoding="utf-8") as f:
+            if all_errors:
                 f.write("\n\nErrors encountered:\n")
                 f.write("\n".join(all_errors))
                 f.write("\n")
-        else:
-            self.status_label.config(text="")
-
-        for method in self.results:
-            df, _ = self.results[method]
-            if method == "fmea":
-                x_axis, y_axis, score_column = "Probability (%)", "Impact (Severity)", "RPN"
-            elif method == "risk matrix":
-                x_axis, y_axis, score_column = "Probability", "Impact", "Risk Score"
-            elif method == "bow-tie":
-                x_axis, y_axis, score_column = "Cause Likelihood", "Consequence Severity", "Barrier Score"
-
-            plt.figure(figsize=(10, 6))
-            plt.scatter(df[x_axis], df[y_axis], s=100, c="blue", alpha=0.5)
-            for i, txt in enumerate(df["Risk Name"]):
-                plt.annotate(txt, (df[x_axis].iloc[i], df[y_axis].iloc[i]))
-            plt.xlabel(x_axis)
-            plt.ylabel(y_axis)
-            plt.title(f"{method.upper()} Risk Matrix")
-            plt.grid(True)
-            plt.savefig(f"risk_matrix_{method}.png")
-            plt.close()
-
-            plt.figure(figsize=(10, 6))
-            plt.bar(df["Risk Name"], df[score_column], color="orange")
-            plt.xlabel("Risk Name")
-            plt.ylabel(score_column)
-            plt.title(f"{score_column} of Risks (Sorted) - {method.upper()}")
-            plt.xticks(rotation=45, ha="right")
-            plt.tight_layout()
-            plt.savefig(f"score_bar_{method}.png")
-            plt.close()
-
-        # Plot the combined scores chart
-        self.plot_combined_scores()
-
-        self.status_label.config(text="Charts saved as 'risk_matrix_[method].png', 'score_bar_[method].png', and 'combined_risk_scores.png'\nResults also saved to 'risk_assessment_results.txt'")
-
-root = tk.Tk()
-app = MethodSelectionWindow(root)
-root.mainloop()
\ No newline at end of file
+
+    def submit_chart(self, label, results):
+        kind, method, _ = CHART_FILES[label]
+        if kind == "combined":
+            # Large registers switch to the score distribution view automatically.
+            return self.charts.submit_combined(self.combined_score_matrix(results))
+        return self.charts.submit_method(kind, results[method][0], method)
+
+    def render_charts(self, labels, progress):
+        # Worker thread. Submits every chart at once, so the pool draws them in
+        # parallel, then copies each to its CHART_FILES name as it is ready.
+        results = self.results
+        names = [self.submit_chart(label, results) for label in labels]
+        paths = []
+        try:
+            for i, (label, name) in enumerate(zip(labels, names)):
+                progress(f"Drawing {label}...", i / len(labels))
+                if not self.charts.wait(name, timeout=None):
+                    raise RuntimeError(f"{label} was not drawn")
+                path = CHART_FILES[label][2]
+                shutil.copyfile(self.charts.path(name), path)
+                paths.append(path)
+        except TaskCancelled:
+            self.charts.cancel(names)
+            raise
+        return paths
+
+    def show_chart(self):
+        label = self.chart_choice.get()
+        self.start_task(lambda progress: self.render_charts([label], progress), lambda paths: self.open_chart(label, paths[0]), "Chart failed")
+
+    def open_chart(self, label, path):
+        window = tk.Toplevel(self.root)
+        window.title(label)
+        image = tk.PhotoImage(master=window, file=path)
+        image_label = tk.Label(window, image=image)
+        image_label.image = image  # Tk does not hold a reference to the image
+        image_label.pack()
+        self.status_label.config(text=f"Chart saved as '{path}'")
+
+    def save_all_charts(self):
+        self.start_task(lambda progress: self.render_charts(list(CHART_FILES), progress), self.charts_saved, "Charts failed")
+
+    def charts_saved(self, paths):
+        self.status_label.config(text="Charts saved as " + ", ".join(f"'{path}'" for path in paths))
+
+    def display_results(self, analysis):
+        if analysis["failed"]:
+            method = analysis["failed"]
+            messagebox.showerror("Error", f"No valid data to process for {method.upper()}. Check your Excel file.\n" + "\n".join(analysis["results"][method][1]))
+            return
+
+        self.results = analysis["results"]
+        self.grid.show(self.results[self.method][0], self.method, analysis["orders"])
+        self.fill_tree(self.top_risks_tree1, self.results[self.other_methods[0]][0].head(3), self.other_methods[0])
+        self.fill_tree(self.top_risks_tree2, self.results[self.other_methods[1]][0].head(3), self.other_methods[1])
+
+        self.status_label.config(text="Results saved to 'risk_assessment_results.txt'\nPick a chart and click 'Show Chart', or 'Save All Charts' to draw them all.")
+        self.what_if_button.config(state=tk.NORMAL)
+        self.show_chart_button.config(state=tk.NORMAL)
+        self.save_charts_button.config(state=tk.NORMAL)
+
+if __name__ == "__main__":
+    # Guarded so chart worker processes that re-import this module do not
+    # open a window.
+    root = tk.Tk()
+    app = MethodSelectionWindow(root)
+    root.mainloop()
\ No newline at end of file
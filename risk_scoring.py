@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+
+METHODS = ["fmea", "risk matrix", "bow-tie"]
+# Scored by lca_service from the LCA model rather than from register columns,
+# so it is not part of METHODS; it has a spec for charts, exports and history.
+ENVIRONMENTAL = "environmental"
+# Impact columns as named by environmental_impact.IMPACT_COLUMNS.
+ENVIRONMENTAL_COLUMNS = ["GWP (kg CO2 eq)", "Acidification (kg SO2 eq)"]
+
+REQUIRED_COLUMNS = [
+    "Risk Name",
+    "Probability (%)",
+    "Impact (Severity)",
+    "Detection",
+    "Probability",
+    "Impact",
+    "Cause Likelihood",
+    "Consequence Severity",
+    "Barrier Effectiveness",
+    "Task Affected"
+]
+
+# Input columns are listed in the order the original row-by-row checks ran, so
+# the first failing column for a row produces the same error message as before.
+METHOD_SPECS = {
+    "fmea": {
+        "label": "FMEA",
+        "score_column": "RPN",
+        "inputs": [
+            ("Probability (%)", 0, 100),
+            ("Impact (Severity)", 1, 10),
+            ("Detection", 1, 10),
+        ],
+    },
+    "risk matrix": {
+        "label": "Risk Matrix",
+        "score_column": "Risk Score",
+        "inputs": [
+            ("Probability", 1, 5),
+            ("Impact", 1, 5),
+        ],
+    },
+    "bow-tie": {
+        "label": "Bow-Tie",
+        "score_column": "Barrier Score",
+        "inputs": [
+            ("Cause Likelihood", 1, 5),
+            ("Consequence Severity", 1, 5),
+            ("Barrier Effectiveness", 1, 5),
+        ],
+    },
+    ENVIRONMENTAL: {
+        "label": "Environmental",
+        "score_column": "Environmental Score",
+        "inputs": [],
+    },
+}
+
+# Error codes per row; range failures use RANGE_ERROR + position of the input column.
+OK, INVALID, MISSING, RANGE_ERROR = 0, 1, 2, 3
+
+
+def get_score_column(method):
+    return METHOD_SPECS[method]["score_column"]
+
+
+def get_result_columns(method):
+    if method == "fmea":
+        return ["Risk Name", "Probability (%)", "Impact (Severity)", "Detection", "Task Affected", "RPN"]
+    elif method == "risk matrix":
+        return ["Risk Name", "Probability", "Impact", "Task Affected", "Risk Score"]
+    elif method == "bow-tie":
+        return ["Risk Name", "Cause Likelihood", "Consequence Severity", "Barrier Effectiveness", "Task Affected", "Barrier Score"]
+    elif method == ENVIRONMENTAL:
+        return ["Risk Name", "Task Affected"] + ENVIRONMENTAL_COLUMNS + ["Environmental Score"]
+
+
+def compute_score(method, values):
+    if method == "fmea":
+        prob, impact, detection = values
+        return (prob / 100) * impact * detection
+    elif method == "risk matrix":
+        prob, impact = values
+        return prob * impact
+    elif method == "bow-tie":
+        cause_likelihood, consequence_severity, barrier_effectiveness = values
+        return (cause_likelihood * consequence_severity) / barrier_effectiveness
+
+
+def coerce_column(series):
+    # Returns (values, failures): float64 values with NaN for missing entries, and
+    # a {position: exception message} dict for entries float() refuses to convert.
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype="float64", na_value=np.nan), {}
+
+    if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+        values = pd.to_numeric(series, errors="coerce").to_numpy(dtype="float64", na_value=np.nan, copy=True)
+    else:
+        # Datetimes and other extension types: let float() decide for every entry.
+        values = np.full(len(series), np.nan)
+    raw = series.to_numpy(dtype=object)
+    failures = {}
+    # Only entries pandas could not parse fall back to float(), which keeps the
+    # row-by-row semantics (None raises, "nan" is missing) and exception text.
+    for pos in np.flatnonzero(np.isnan(values)):
+        try:
+            values[pos] = float(raw[pos])
+        except (ValueError, TypeError) as e:
+            failures[int(pos)] = str(e)
+    return values, failures
+
+
+def coerce_frame(df, columns):
+    return {col: coerce_column(df[col]) for col in columns}
+
+
+def validate_method(method, coerced, n_rows):
+    spec = METHOD_SPECS[method]
+    codes = np.zeros(n_rows, dtype=np.int8)
+    messages = {}
+
+    # float() raised on one of the inputs: the first column that failed wins.
+    for col, _, _ in spec["inputs"]:
+        for pos, message in coerced[col][1].items():
+            if pos not in messages:
+                codes[pos] = INVALID
+                messages[pos] = message
+
+    missing = np.zeros(n_rows, dtype=bool)
+    for col, _, _ in spec["inputs"]:
+        missing |= np.isnan(coerced[col][0])
+    codes[(codes == OK) & missing] = MISSING
+
+    for position, (col, low, high) in enumerate(spec["inputs"]):
+        values = coerced[col][0]
+        out_of_range = (codes == OK) & ((values < low) | (values > high))
+        codes[out_of_range] = RANGE_ERROR + position
+
+    return codes, messages
+
+
+def error_details(method, codes, messages, coerced, row_labels):
+    # One dict per rejected row, in row order: the spreadsheet row number, the
+    # offending column (None when several may be at fault), the kind of error
+    # and the same message text calculate_risk has always reported.
+    spec = METHOD_SPECS[method]
+    label = spec["label"]
+    details = []
+    for pos in np.flatnonzero(codes):
+        code = codes[pos]
+        row = row_labels[pos] + 2
+        if code == INVALID:
+            column = next(col for col, _, _ in spec["inputs"] if pos in coerced[col][1])
+            kind = "invalid"
+            message = f"Row {row}: Invalid data - {messages[pos]} ({method.upper()})"
+        elif code == MISSING:
+            column = None
+            kind = "missing"
+            message = f"Row {row}: Missing or invalid data in one of the columns ({label})"
+        else:
+            column, low, high = spec["inputs"][code - RANGE_ERROR]
+            kind = "out_of_range"
+            value = float(coerced[column][0][pos])
+            message = f"Row {row}: {column} must be between {low} and {high}, got {value} ({label})"
+        details.append({"row": row.item() if hasattr(row, "item") else row, "method": method, "column": column, "type": kind, "message": message})
+    return details
+
+
+def format_errors(method, codes, messages, coerced, row_labels):
+    return [detail["message"] for detail in error_details(method, codes, messages, coerced, row_labels)]
+
+
+def score_methods(df, methods=None, detailed_errors=False):
+    # Scores every requested method in one pass: each numeric column is coerced
+    # once, validated with masks, and the score is computed column-wise.
+    # Returns {method: (result_df or None, errors)} with the same contract as the
+    # former per-row calculate_risk; with detailed_errors the errors are the
+    # dicts from error_details instead of message strings.
+    methods = METHODS if methods is None else methods
+    needed = []
+    for method in methods:
+        for col, _, _ in METHOD_SPECS[method]["inputs"]:
+            if col not in needed:
+                needed.append(col)
+
+    n_rows = len(df)
+    coerced = coerce_frame(df, needed)
+    row_labels = df.index.to_numpy()
+
+    results = {}
+    for method in methods:
+        spec = METHOD_SPECS[method]
+        codes, messages = validate_method(method, coerced, n_rows)
+        if detailed_errors:
+            errors = error_details(method, codes, messages, coerced, row_labels)
+        else:
+            errors = format_errors(method, codes, messages, coerced, row_labels)
+
+        valid = codes == OK
+        if not valid.any():
+            results[method] = (None, errors)
+            continue
+
+        values = [coerced[col][0][valid] for col, _, _ in spec["inputs"]]
+        result = df.loc[valid].copy()
+        result[spec["score_column"]] = compute_score(method, values)
+        result = result.sort_values(by=spec["score_column"], ascending=False)
+        results[method] = (result, errors)
+    return results
+
+
+def calculate_risk(df, method):
+    return score_methods(df, [method])[method]
+
+
+def normalize_score(score, method):
+    # Works on scalars as well as NumPy arrays / Series.
+    if method == "fmea":
+        return score  # Already in range 0 to 100
+    elif method == "risk matrix":
+        # Risk Score range: 1 to 25, map to 0 to 100
+        return ((score - 1) / (25 - 1)) * 100
+    elif method == "bow-tie":
+        # Barrier Score range: 0.2 to 25, map to 0 to 100
+        return ((score - 0.2) / (25 - 0.2)) * 100
+    elif method == ENVIRONMENTAL:
+        return score  # Already in range 0 to 100 (see lca_service.normalize_impacts)
+    return score
+
+
+def align_scores(results, risk_names, row_index=None):
+    # Builds the normalized score matrix for the comparison chart in one keyed
+    # alignment per method: one row per entry of risk_names (original order),
+    # one column per method, 0 (before normalization) where a risk was rejected.
+    # The environmental column is NaN instead for risks it did not score, most
+    # of which simply have no LCA process mapped.
+    #
+    # Result frames keep the source row labels, so when row_index (the source
+    # frame's index) is given and unique every row is matched to its own score,
+    # duplicate names included. Otherwise rows are matched by Risk Name and a
+    # duplicated name takes its highest-ranked score, as the chart always did.
+    risk_names = list(risk_names)
+    by_row = row_index is not None and len(row_index) == len(risk_names) and row_index.is_unique
+    matrix = pd.DataFrame({"Risk Name": risk_names})
+
+    for method, (df, _) in results.items():
+        if method not in METHOD_SPECS:
+            continue
+        score_column = get_score_column(method)
+        if df is None:
+            scores = np.full(len(risk_names), np.nan)
+        elif by_row:
+            scores = df[score_column].reindex(row_index).to_numpy(dtype="float64", na_value=np.nan)
+        else:
+            # df is sorted by score, so keep="first" keeps the top score per name.
+            lookup = df.drop_duplicates(subset="Risk Name", keep="first").set_index("Risk Name")[score_column]
+            scores = lookup.reindex(risk_names).to_numpy(dtype="float64", na_value=np.nan)
+        if method != ENVIRONMENTAL:
+            scores = np.where(np.isnan(scores), 0.0, scores)
+        matrix[method] = normalize_score(scores, method)
+    return matrix
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+import risk_scoring
+import task_rollup
+
+DEFAULT_CHUNK_SIZE = 20000
+DEFAULT_TOP_K = 1000
+# Per-method cap on kept error messages; the total is still counted.
+MAX_ERROR_MESSAGES = 1000
+
+
+class MissingColumnsError(ValueError):
+    def __init__(self, required_columns, missing_columns):
+        self.required_columns = required_columns
+        self.missing_columns = missing_columns
+        super().__init__(
+            f"Excel file must contain the following columns: {', '.join(required_columns)}\n"
+            f"Missing columns: {', '.join(missing_columns)}"
+        )
+
+    def __reduce__(self):
+        # Keeps the error picklable when it is raised inside a pool worker.
+        return (MissingColumnsError, (self.required_columns, self.missing_columns))
+
+
+def make_header(cells):
+    # Mirrors pd.read_excel: blank headers become "Unnamed: i" and repeated
+    # names get ".1", ".2", ... suffixes.
+    header = []
+    seen = {}
+    for i, cell in enumerate(cells):
+        name = f"Unnamed: {i}" if cell is None or str(cell).strip() == "" else str(cell)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        header.append(name)
+    return header
+
+
+def check_columns(columns, required_columns=None):
+    required_columns = risk_scoring.REQUIRED_COLUMNS if required_columns is None else required_columns
+    missing_cols = [col for col in required_columns if col not in columns]
+    if missing_cols:
+        raise MissingColumnsError(required_columns, missing_cols)
+
+
+def select_sheets(workbook, sheet_name):
+    if sheet_name is None:
+        return list(workbook.worksheets)
+    if isinstance(sheet_name, int):
+        return [workbook.worksheets[sheet_name]]
+    return [workbook[sheet_name]]
+
+
+def read_header(path, sheet_name=0):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = select_sheets(workbook, sheet_name)[0]
+        first_row = next(sheet.iter_rows(values_only=True), ())
+        return make_header(first_row)
+    finally:
+        workbook.close()
+
+
+def rows_to_frame(rows, header, start_label):
+    df = pd.DataFrame.from_records(rows, columns=header, coerce_float=True)
+    # openpyxl hands back None for empty cells where read_excel gives NaN.
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    df.index = pd.RangeIndex(start_label, start_label + len(df))
+    return df
+
+
+def iter_excel_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, sheet_name=0, required_columns=None):
+    # Yields (sheet_title, chunk_df) pairs. Chunks are indexed by their 0-based
+    # data row, as with pd.read_excel, so "Row {idx + 2}" still points at the
+    # spreadsheet row. The header is checked before any data row is read.
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in select_sheets(workbook, sheet_name):
+            rows_iter = sheet.iter_rows(values_only=True)
+            header = make_header(next(rows_iter, ()))
+            check_columns(header, required_columns)
+            width = len(header)
+
+            rows = []
+            start_label = 0
+            pending_blank = 0
+            for values in rows_iter:
+                values = tuple(values[:width]) + (None,) * (width - len(values))
+                # Blank rows are only kept when data follows them; trailing
+                # blanks are dropped like read_excel does.
+                if all(v is None for v in values):
+                    pending_blank += 1
+                    continue
+                if pending_blank:
+                    rows.extend([(None,) * width] * pending_blank)
+                    pending_blank = 0
+                rows.append(values)
+                if len(rows) >= chunk_size:
+                    yield sheet.title, rows_to_frame(rows, header, start_label)
+                    start_label += len(rows)
+                    rows = []
+            if rows:
+                yield sheet.title, rows_to_frame(rows, header, start_label)
+    finally:
+        workbook.close()
+
+
+class StreamedAssessment:
+    def __init__(self, methods, top_k):
+        self.methods = list(methods)
+        self.top_k = top_k
+        self.rows = 0
+        self.top = {method: None for method in self.methods}
+        self.valid_counts = {method: 0 for method in self.methods}
+        self.error_counts = {method: 0 for method in self.methods}
+        self.errors = {method: [] for method in self.methods}
+        # Built from every scored chunk, so it covers all rows, not just the top-K.
+        self.rollup = task_rollup.TaskRollup(self.methods)
+
+    def add(self, method, df, errors, sheet_title=None):
+        self.error_counts[method] += len(errors)
+        room = MAX_ERROR_MESSAGES - len(self.errors[method])
+        if room > 0:
+            if sheet_title is not None:
+                errors = [f"[{sheet_title}] {error}" for error in errors[:room]]
+            self.errors[method].extend(errors[:room])
+        if df is None:
+            return
+
+        self.valid_counts[method] += len(df)
+        self.rollup.add(method, df)
+        # df is already sorted by score, so only its head can enter the top-K.
+        candidates = df.head(self.top_k)
+        if self.top[method] is not None:
+            candidates = pd.concat([self.top[method], candidates])
+        score_column = risk_scoring.get_score_column(method)
+        self.top[method] = candidates.sort_values(by=score_column, ascending=False, kind="stable").head(self.top_k)
+
+    def all_errors(self):
+        errors = []
+        for method in self.methods:
+            errors.extend(self.errors[method])
+            hidden = self.error_counts[method] - len(self.errors[method])
+            if hidden > 0:
+                errors.append(f"... {hidden} more errors ({method.upper()})")
+        return errors
+
+    def as_results(self):
+        # Same {method: (df or None, errors)} shape as risk_scoring.score_methods,
+        # with df holding the running top-K instead of every valid row.
+        return {method: (self.top[method], self.errors[method]) for method in self.methods}
+
+
+def stream_assessment(path, methods=None, chunk_size=DEFAULT_CHUNK_SIZE, top_k=DEFAULT_TOP_K, sheet_name=0, on_chunk=None):
+    # Scores an .xlsx register chunk by chunk; peak memory depends on
+    # chunk_size and top_k, not on the size of the workbook. on_chunk, if
+    # given, is called with the number of rows scored so far.
+    methods = risk_scoring.METHODS if methods is None else methods
+    summary = StreamedAssessment(methods, top_k)
+    label_sheets = sheet_name is None
+    for sheet_title, chunk in iter_excel_chunks(path, chunk_size=chunk_size, sheet_name=sheet_name):
+        summary.rows += len(chunk)
+        for method, (df, errors) in risk_scoring.score_methods(chunk, methods).items():
+            summary.add(method, df, errors, sheet_title if label_sheets else None)
+        if on_chunk is not None:
+            on_chunk(summary.rows)
+    return summary
@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+
+import risk_scoring
+
+DEFAULT_SAMPLES = 10000
+DEFAULT_SEED = 0
+DEFAULT_TOP_N = 10
+PERCENTILES = (5, 50, 95)
+# Upper bound on the values drawn per input in one array operation. Blocks
+# this size stay in cache, and peak memory does not grow with N.
+CHUNK_VALUES = 1 << 18
+# Rank statistics need every risk of a draw at once, so they use the first
+# RANK_SAMPLES draws rather than all N.
+RANK_SAMPLES = 2000
+
+
+def range_columns(col):
+    return f"{col} Min", f"{col} Max"
+
+
+def has_ranges(df, methods=None):
+    methods = risk_scoring.METHODS if methods is None else methods
+    return any(
+        name in df.columns
+        for method in methods
+        for col, _, _ in risk_scoring.METHOD_SPECS[method]["inputs"]
+        for name in range_columns(col)
+    )
+
+
+def triangular_bounds(df, method, result):
+    # (min, likely, max) arrays per input for the rows of result, the valid
+    # rows of a point assessment. Likely is the existing column; a missing or
+    # blank Min/Max collapses that side onto it. Returns the bounds and the
+    # positions (into result) of rows whose range is unusable, with messages.
+    spec = risk_scoring.METHOD_SPECS[method]
+    bounds = []
+    bad = {}
+    row_labels = result.index.to_numpy()
+    for col, low, high in spec["inputs"]:
+        likely = result[col].to_numpy(dtype="float64")
+        sides = []
+        for name in range_columns(col):
+            if name not in df.columns:
+                sides.append(likely)
+                continue
+            values, failures = risk_scoring.coerce_column(df.loc[result.index, name])
+            for pos, message in failures.items():
+                bad.setdefault(pos, f"Row {row_labels[pos] + 2}: Invalid data - {message} ({method.upper()})")
+            values = np.where(np.isnan(values), likely, values)
+            out_of_range = (values < low) | (values > high)
+            for pos in np.flatnonzero(out_of_range):
+                bad.setdefault(int(pos), f"Row {row_labels[pos] + 2}: {name} must be between {low} and {high}, got {float(values[pos])} ({spec['label']})")
+            sides.append(values)
+        lower, upper = sides
+        for pos in np.flatnonzero((lower > likely) | (upper < likely)):
+            bad.setdefault(int(pos), f"Row {row_labels[pos] + 2}: {col} must lie between {col} Min and {col} Max ({spec['label']})")
+        bounds.append((lower, likely, upper))
+    return bounds, bad
+
+
+def sample_triangular(rng, lower, likely, upper, n_samples):
+    # n_samples float32 draws per row, as a (rows, n_samples) array, by
+    # inverting the triangular CDF. Rows without a range are broadcast
+    # instead of drawn.
+    width = (upper - lower).astype("float32")
+    if not width.any():
+        return np.broadcast_to(likely.astype("float32")[:, None], (len(likely), n_samples))
+    mode = np.divide(likely - lower, width, out=np.zeros(len(width), dtype="float32"), where=width > 0)[:, None]
+    u = rng.random((len(likely), n_samples), dtype=np.float32)
+    # Standard triangular on [0, 1]: sqrt(u * m) below the mode,
+    # 1 - sqrt((1 - u) * (1 - m)) above it; then scaled onto [lower, upper].
+    rising = np.sqrt(u * mode)
+    falling = 1 - np.sqrt((1 - u) * (1 - mode))
+    draws = np.where(u < mode, rising, falling)
+    draws *= width[:, None]
+    draws += lower.astype("float32")[:, None]
+    return draws
+
+
+def draw_scores(method, bounds, rows, n_samples, rng):
+    # Score samples for the given row positions, shape (len(rows), n_samples).
+    values = [sample_triangular(rng, lower[rows], likely[rows], upper[rows], n_samples) for lower, likely, upper in bounds]
+    return risk_scoring.compute_score(method, values)
+
+
+def unique_bounds(bounds):
+    # Risks with the same (min, likely, max) on every input share one score
+    # distribution; on 1-5 and 1-10 scales there are few such combinations.
+    # Returns the distinct bounds and, per risk, the position of its own.
+    stacked = np.column_stack([side for triplet in bounds for side in triplet])
+    distinct, inverse = np.unique(stacked, axis=0, return_inverse=True)
+    sides = [distinct[:, j] for j in range(distinct.shape[1])]
+    return [tuple(sides[3 * k:3 * k + 3]) for k in range(len(bounds))], inverse.ravel()
+
+
+def score_percentiles(method, bounds, n_samples, rng, on_chunk=None):
+    # Percentiles and mean per distinct input combination over all n_samples
+    # draws, computed over blocks so at most CHUNK_VALUES values per input
+    # exist at once. Returns one row of statistics per risk.
+    bounds, inverse = unique_bounds(bounds)
+    n_rows = len(bounds[0][0])
+    block = max(1, CHUNK_VALUES // n_samples)
+    stats = np.empty((n_rows, len(PERCENTILES) + 1))
+    for start in range(0, n_rows, block):
+        rows = np.arange(start, min(start + block, n_rows))
+        scores = draw_scores(method, bounds, rows, n_samples, rng)
+        stats[rows, :len(PERCENTILES)] = np.percentile(scores, PERCENTILES, axis=1).T
+        stats[rows, -1] = scores.mean(axis=1, dtype="float64")
+        if on_chunk is not None:
+            on_chunk(rows[-1] + 1, n_rows)
+    return stats[inverse]
+
+
+def rank_stability(method, bounds, n_rows, n_samples, top_n, rng):
+    # Rank of each risk within every draw (1 = highest score), accumulated
+    # over blocks of draws: mean rank, its standard deviation and how often
+    # the risk lands in the top_n.
+    block = max(1, CHUNK_VALUES // max(n_rows, 1))
+    rows = np.arange(n_rows)
+    ranks = np.arange(1, n_rows + 1, dtype="float64")
+    rank_sum = np.zeros(n_rows)
+    rank_sq = np.zeros(n_rows)
+    in_top = np.zeros(n_rows)
+    for start in range(0, n_samples, block):
+        size = min(block, n_samples - start)
+        # One draw per row of order, listing risk positions best first.
+        order = np.argsort(-np.ascontiguousarray(draw_scores(method, bounds, rows, size, rng).T), axis=1, kind="stable")
+        rank_sum += np.bincount(order.ravel(), weights=np.tile(ranks, size), minlength=n_rows)
+        rank_sq += np.bincount(order.ravel(), weights=np.tile(ranks ** 2, size), minlength=n_rows)
+        in_top += np.bincount(order[:, :top_n].ravel(), minlength=n_rows)
+    mean = rank_sum / n_samples
+    std = np.sqrt(np.maximum(rank_sq / n_samples - mean ** 2, 0))
+    return mean, std, in_top / n_samples
+
+
+def result_columns(method, top_n=DEFAULT_TOP_N):
+    score_column = risk_scoring.get_score_column(method)
+    return (
+        ["Risk Name", "Task Affected", score_column]
+        + [f"{score_column} P{p}" for p in PERCENTILES]
+        + [f"{score_column} Mean", "Rank", "Mean Rank", "Rank Std", f"Top {top_n} Probability"]
+    )
+
+
+def simulate(df, methods=None, n_samples=DEFAULT_SAMPLES, seed=DEFAULT_SEED, top_n=DEFAULT_TOP_N, progress=None):
+    # Monte Carlo version of risk_scoring.score_methods. Each input is drawn
+    # from a triangular distribution over its "<column> Min", the column itself
+    # (most likely) and "<column> Max". Returns {method: (df or None, errors)}
+    # with the point score, P5/P50/P95, the mean and rank statistics per risk,
+    # sorted by P50. The same seed always gives the same numbers.
+    methods = risk_scoring.METHODS if methods is None else methods
+    n_samples = max(int(n_samples), 1)
+    rank_samples = min(n_samples, RANK_SAMPLES)
+    seeds = np.random.SeedSequence(seed).spawn(2 * len(methods))
+    point = risk_scoring.score_methods(df, methods)
+
+    results = {}
+    for i, method in enumerate(methods):
+        result, errors = point[method]
+        if result is None:
+            results[method] = (None, errors)
+            continue
+        bounds, bad = triangular_bounds(df, method, result)
+        if bad:
+            keep = np.ones(len(result), dtype=bool)
+            keep[list(bad)] = False
+            errors = errors + [bad[pos] for pos in sorted(bad, key=lambda pos: result.index[pos])]
+            result = result.iloc[keep]
+            bounds = [(lower[keep], likely[keep], upper[keep]) for lower, likely, upper in bounds]
+        if result.empty:
+            results[method] = (None, errors)
+            continue
+
+        on_chunk = None
+        if progress is not None:
+            on_chunk = lambda done, total, i=i: progress(f"simulating {method.upper()} ({done}/{total} input combinations)", (i + 0.8 * done / total) / len(methods))
+        n_rows = len(result)
+        stats = score_percentiles(method, bounds, n_samples, np.random.default_rng(seeds[2 * i]), on_chunk)
+        mean_rank, rank_std, top_share = rank_stability(method, bounds, n_rows, rank_samples, top_n, np.random.default_rng(seeds[2 * i + 1]))
+
+        score_column = risk_scoring.get_score_column(method)
+        columns = result_columns(method, top_n)
+        frame = pd.DataFrame({
+            "Risk Name": result["Risk Name"].to_numpy(),
+            "Task Affected": result["Task Affected"].to_numpy(),
+            score_column: result[score_column].to_numpy(dtype="float64"),
+        }, index=result.index)
+        for j, col in enumerate(columns[3:3 + len(PERCENTILES) + 1]):
+            frame[col] = stats[:, j]
+        # result is sorted by point score, so its position is the point rank.
+        frame["Rank"] = np.arange(1, n_rows + 1)
+        frame["Mean Rank"] = mean_rank
+        frame["Rank Std"] = rank_std
+        frame[columns[-1]] = top_share
+        frame = frame.sort_values(by=f"{score_column} P50", ascending=False, kind="stable")
+        results[method] = (frame[columns], errors)
+    if progress is not None:
+        progress("done", 1.0)
+    return results
@@ -0,0 +1,160 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+import risk_scoring
+
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json-lines": "jsonl",
+    "application/x-jsonlines": "jsonl",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+}
+
+EXTENSIONS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".parquet": "parquet",
+    ".xlsx": "xlsx",
+}
+
+
+class ScoreApiError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def detect_format(content_type=None, filename=None, explicit=None):
+    if explicit:
+        if explicit not in set(EXTENSIONS.values()):
+            raise ScoreApiError(f"Unsupported input format: {explicit}", 415)
+        return explicit
+    if filename:
+        for extension, fmt in EXTENSIONS.items():
+            if filename.lower().endswith(extension):
+                return fmt
+    mimetype = (content_type or "").split(";")[0].strip().lower()
+    if mimetype in CONTENT_TYPES:
+        return CONTENT_TYPES[mimetype]
+    raise ScoreApiError(
+        "Could not tell the input format; send a CSV, JSON lines, Parquet or XLSX body "
+        "with a matching Content-Type or pass ?input=csv|jsonl|parquet|xlsx.", 415
+    )
+
+
+def read_frame(data, fmt):
+    if not data:
+        raise ScoreApiError("Request body is empty.")
+    buf = io.BytesIO(data)
+    try:
+        if fmt == "csv":
+            return pd.read_csv(buf)
+        if fmt == "jsonl":
+            return pd.read_json(buf, lines=True)
+        if fmt == "parquet":
+            return pd.read_parquet(buf)
+        return pd.read_excel(buf)
+    except ImportError as e:
+        raise ScoreApiError(f"Reading {fmt} input is not available on this server: {str(e)}", 415)
+
+
+def parse_methods(value):
+    if not value or value.strip().lower() == "all":
+        return list(risk_scoring.METHODS)
+    methods = [m.strip().lower() for m in value.split(",") if m.strip()]
+    unknown = [m for m in methods if m not in risk_scoring.METHODS]
+    if unknown:
+        raise ScoreApiError(f"Unknown method(s): {', '.join(unknown)}. Use one or more of: {', '.join(risk_scoring.METHODS)}")
+    return list(dict.fromkeys(methods))
+
+
+def score_frame(df, methods):
+    # Returns {method: (scored frame or None, error dicts)}. Scored frames hold
+    # the method's result columns plus the spreadsheet Row and the normalized
+    # score, sorted by score like the web results.
+    missing_cols = [col for col in risk_scoring.REQUIRED_COLUMNS if col not in df.columns]
+    if missing_cols:
+        raise ScoreApiError(f"Input must contain the following columns: {', '.join(risk_scoring.REQUIRED_COLUMNS)}. Missing columns: {', '.join(missing_cols)}", 422)
+
+    scored = {}
+    for method, (result, errors) in risk_scoring.score_methods(df, methods, detailed_errors=True).items():
+        if result is not None:
+            score_column = risk_scoring.get_score_column(method)
+            rows = result.index.to_numpy() + 2
+            result = result[risk_scoring.get_result_columns(method)].copy()
+            result.insert(0, "Row", rows)
+            result["Normalized Score"] = risk_scoring.normalize_score(result[score_column].to_numpy(dtype="float64"), method)
+        scored[method] = (result, errors)
+    return scored
+
+
+def json_records(df):
+    df = df.astype(object).where(df.notna(), None)
+    return [
+        {key: (value.item() if isinstance(value, np.generic) else value) for key, value in record.items()}
+        for record in df.to_dict(orient="records")
+    ]
+
+
+def to_json_payload(scored):
+    payload = {"methods": {}}
+    for method, (result, errors) in scored.items():
+        payload["methods"][method] = {
+            "score_column": risk_scoring.get_score_column(method),
+            "scored": 0 if result is None else len(result),
+            "rows": [] if result is None else json_records(result),
+            "errors": errors,
+        }
+    return payload
+
+
+def to_long_frame(scored):
+    # One row per (method, scored risk) with the columns every method shares,
+    # so all methods fit a single Arrow schema.
+    frames = []
+    for method, (result, _) in scored.items():
+        if result is None:
+            continue
+        score_column = risk_scoring.get_score_column(method)
+        frames.append(pd.DataFrame({
+            "Method": method,
+            "Row": result["Row"].to_numpy(),
+            "Risk Name": result["Risk Name"].astype(str).to_numpy(),
+            "Task Affected": result["Task Affected"].astype(str).to_numpy(),
+            "Score": result[score_column].to_numpy(dtype="float64"),
+            "Normalized Score": result["Normalized Score"].to_numpy(dtype="float64"),
+        }))
+    if not frames:
+        return pd.DataFrame({
+            "Method": pd.Series(dtype=str), "Row": pd.Series(dtype="int64"),
+            "Risk Name": pd.Series(dtype=str), "Task Affected": pd.Series(dtype=str),
+            "Score": pd.Series(dtype="float64"), "Normalized Score": pd.Series(dtype="float64"),
+        })
+    return pd.concat(frames, ignore_index=True)
+
+
+def to_arrow_ipc(scored):
+    # Arrow IPC stream of to_long_frame; the structured errors travel as JSON
+    # in the schema metadata under "errors".
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ScoreApiError("Arrow output needs pyarrow, which is not installed on this server.", 406)
+    errors = [error for _, method_errors in scored.values() for error in method_errors]
+    table = pa.Table.from_pandas(to_long_frame(scored), preserve_index=False)
+    table = table.replace_schema_metadata({"errors": json.dumps(errors)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
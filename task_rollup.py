@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+import risk_scoring
+
+# Bands on the normalized (0 to 100) score, so they mean the same for every method.
+SCORE_BANDS = [("Low", 0), ("Medium", 25), ("High", 50), ("Critical", 75)]
+BAND_NAMES = [name for name, _ in SCORE_BANDS]
+DEFAULT_TOP_K = 5
+BLANK_TASK = "(blank)"
+
+
+def band_positions(scores, method):
+    edges = np.array([low for _, low in SCORE_BANDS[1:]], dtype="float64")
+    return np.searchsorted(edges, risk_scoring.normalize_score(scores, method), side="right")
+
+
+def merge_top(top, candidates, top_k):
+    # top lists hold (score, risk name) pairs, highest first.
+    return sorted(top + candidates, key=lambda item: -item[0])[:top_k]
+
+
+class TaskRollup:
+    # Count, sum, max and the top_k risks per (Task Affected, score band) cell
+    # for each method. Cells merge, so a register can be added whole or chunk
+    # by chunk; per-task and per-band figures are read from the cells.
+    def __init__(self, methods=None, top_k=DEFAULT_TOP_K):
+        self.methods = list(risk_scoring.METHODS if methods is None else methods)
+        self.top_k = top_k
+        self.cells = {method: {} for method in self.methods}
+
+    def add(self, method, df):
+        # df: scored rows for the method, as in score_methods' results. Rows
+        # are grouped on integer cell keys; names are only read for the rows
+        # that make a cell's top_k.
+        if df is None or df.empty:
+            return
+        scores = df[risk_scoring.get_score_column(method)].to_numpy(dtype="float64")
+        codes, tasks = pd.factorize(df["Task Affected"], use_na_sentinel=False)
+        n_bands = len(SCORE_BANDS)
+        keys = codes * n_bands + band_positions(scores, method)
+        size = len(tasks) * n_bands
+        counts = np.bincount(keys, minlength=size)
+        sums = np.bincount(keys, weights=scores, minlength=size)
+        # Highest score first within each cell; a row's place in that order
+        # minus its cell's first place is its rank within the cell.
+        order = np.lexsort((-scores, keys))
+        starts = np.cumsum(counts) - counts
+        in_cell = np.arange(len(order)) - starts[keys[order]]
+        top_rows = order[in_cell < self.top_k]
+        names = df["Risk Name"].iloc[top_rows].astype(str).tolist()
+        top_lists = {}
+        for key, score, name in zip(keys[top_rows].tolist(), scores[top_rows].tolist(), names):
+            top_lists.setdefault(key, []).append((score, name))
+
+        cells = self.cells[method]
+        for key in np.flatnonzero(counts).tolist():
+            task = tasks[key // n_bands]
+            cell_key = (BLANK_TASK if pd.isna(task) else str(task), key % n_bands)
+            top = top_lists[key]
+            cell = cells.get(cell_key)
+            if cell is None:
+                cells[cell_key] = {"count": int(counts[key]), "sum": float(sums[key]), "max": top[0][0], "top": top}
+            else:
+                cell["count"] += int(counts[key])
+                cell["sum"] += float(sums[key])
+                cell["max"] = max(cell["max"], top[0][0])
+                cell["top"] = merge_top(cell["top"], top, self.top_k)
+
+    def combine(self, cells):
+        summary = {"count": 0, "sum": 0.0, "max": None, "top": []}
+        for cell in cells:
+            summary["count"] += cell["count"]
+            summary["sum"] += cell["sum"]
+            summary["max"] = cell["max"] if summary["max"] is None else max(summary["max"], cell["max"])
+            summary["top"] = merge_top(summary["top"], cell["top"], self.top_k)
+        return summary
+
+    def as_dict(self):
+        # {method: {"bands": [...], "totals": {...}, "by_band": {band: {...}},
+        #  "tasks": [{"task", "count", "sum", "max", "mean", "top", "bands"}]}}
+        # with tasks ordered by their highest score.
+        cube = {}
+        for method in self.methods:
+            cells = self.cells[method]
+            by_task = {}
+            for (task, band), cell in cells.items():
+                by_task.setdefault(task, {})[BAND_NAMES[band]] = cell
+            tasks = []
+            for task, bands in by_task.items():
+                row = {"task": task}
+                row.update(self.export(self.combine(bands.values())))
+                row["bands"] = {band: self.export(cell) for band, cell in bands.items()}
+                tasks.append(row)
+            tasks.sort(key=lambda row: (-row["max"], row["task"]))
+            cube[method] = {
+                "bands": BAND_NAMES,
+                "totals": self.export(self.combine(cells.values())),
+                "by_band": {
+                    name: self.export(self.combine(cell for (_, band), cell in cells.items() if band == position))
+                    for position, name in enumerate(BAND_NAMES)
+                },
+                "tasks": tasks,
+            }
+        return cube
+
+    def export(self, cell):
+        return {
+            "count": cell["count"],
+            "sum": cell["sum"],
+            "max": cell["max"],
+            "mean": cell["sum"] / cell["count"] if cell["count"] else None,
+            "top": [{"risk": name, "score": score} for score, name in cell["top"]],
+        }
+
+
+def build_rollup(results, top_k=DEFAULT_TOP_K):
+    rollup = TaskRollup([method for method in results if method in risk_scoring.METHOD_SPECS], top_k)
+    for method in rollup.methods:
+        rollup.add(method, results[method][0])
+    return rollup.as_dict()
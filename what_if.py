@@ -0,0 +1,145 @@
+import threading
+
+import numpy as np
+from sortedcontainers import SortedList
+
+import risk_scoring
+
+
+class WhatIfSession:
+    # An editable copy of a scored register. Each method keeps its valid rows
+    # in a SortedList of (-score, row position) keys, so an edit moves one key
+    # in O(log n) and ranks and top-N lists are read without re-sorting.
+    # Rows are addressed by spreadsheet row number (position + 2), the same
+    # numbering the error messages use.
+    def __init__(self, df, methods=None):
+        self.methods = list(risk_scoring.METHODS if methods is None else methods)
+        self.df = df.reset_index(drop=True).copy()
+        self.version = 0
+        self.lock = threading.Lock()
+        self.scores = {}
+        self.rankings = {}
+        self.errors = {}
+        n_rows = len(self.df)
+        for method, (result, errors) in risk_scoring.score_methods(self.df, self.methods, detailed_errors=True).items():
+            scores = np.full(n_rows, np.nan)
+            if result is not None:
+                scores[result.index.to_numpy()] = result[risk_scoring.get_score_column(method)].to_numpy(dtype="float64")
+            self.scores[method] = scores
+            valid = np.flatnonzero(~np.isnan(scores))
+            self.rankings[method] = SortedList(zip((-scores[valid]).tolist(), valid.tolist()))
+            self.errors[method] = {error["row"] - 2: error["message"] for error in errors}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("lock")
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def position(self, row):
+        # row is a whole number or its text; a fraction is rejected rather
+        # than truncated by int().
+        if isinstance(row, float) and row.is_integer():
+            row = int(row)
+        if isinstance(row, bool) or not isinstance(row, (int, str)) or not str(row).strip().lstrip("-").isdigit():
+            raise ValueError(f"Row must be a whole number, got {row!r}.")
+        pos = int(row) - 2
+        if not 0 <= pos < len(self.df):
+            raise ValueError(f"Row {row} is not in the register (rows 2 to {len(self.df) + 1}).")
+        return pos
+
+    def rank(self, method, pos):
+        # 1-based rank of the row, or None while it is not validly scored.
+        score = self.scores[method][pos]
+        if np.isnan(score):
+            return None
+        return self.rankings[method].index((-score, pos)) + 1
+
+    def set_cell(self, pos, column, value):
+        try:
+            self.df.at[pos, column] = value
+        except (TypeError, ValueError):
+            # The column's dtype cannot hold the value (e.g. text in a number column).
+            self.df[column] = self.df[column].astype(object)
+            self.df.at[pos, column] = value
+
+    def apply(self, edits):
+        # edits: iterable of {"row": spreadsheet row, "column": name, "value": v}.
+        # Only the edited rows are rescored, and only for the methods that use
+        # an edited column. Returns one change record per (method, row) whose
+        # score or rank was recomputed, with the score and rank before and after.
+        edits = list(edits)
+        for edit in edits:
+            if edit.get("column") not in self.df.columns:
+                raise ValueError(f"Unknown column: {edit.get('column')}")
+            self.position(edit.get("row"))
+
+        with self.lock:
+            touched = {}
+            for edit in edits:
+                pos = self.position(edit["row"])
+                self.set_cell(pos, edit["column"], edit.get("value"))
+                touched.setdefault(pos, set()).add(edit["column"])
+
+            affected = {
+                method: sorted(pos for pos, columns in touched.items() if columns & {col for col, _, _ in risk_scoring.METHOD_SPECS[method]["inputs"]})
+                for method in self.methods
+            }
+            before = {(method, pos): (self.scores[method][pos], self.rank(method, pos)) for method, positions in affected.items() for pos in positions}
+
+            for method, positions in affected.items():
+                if not positions:
+                    continue
+                result, errors = risk_scoring.score_methods(self.df.iloc[positions], [method], detailed_errors=True)[method]
+                ranking = self.rankings[method]
+                scores = self.scores[method]
+                for pos in positions:
+                    if not np.isnan(scores[pos]):
+                        ranking.remove((-scores[pos], pos))
+                    scores[pos] = np.nan
+                    self.errors[method].pop(pos, None)
+                if result is not None:
+                    for pos, score in zip(result.index.tolist(), result[risk_scoring.get_score_column(method)].tolist()):
+                        scores[pos] = score
+                        ranking.add((-score, pos))
+                for error in errors:
+                    self.errors[method][error["row"] - 2] = error["message"]
+            self.version += 1
+
+            changes = []
+            for (method, pos), (old_score, old_rank) in before.items():
+                new_score = self.scores[method][pos]
+                risk = self.df.at[pos, "Risk Name"]
+                changes.append({
+                    "method": method,
+                    "row": pos + 2,
+                    "risk": risk.item() if isinstance(risk, np.generic) else risk,
+                    "old_score": None if np.isnan(old_score) else float(old_score),
+                    "new_score": None if np.isnan(new_score) else float(new_score),
+                    "old_rank": old_rank,
+                    "new_rank": self.rank(method, pos),
+                    "error": self.errors[method].get(pos),
+                })
+            return changes
+
+    def frame(self, method, positions):
+        columns = risk_scoring.get_result_columns(method)
+        frame = self.df.iloc[positions][columns[:-1]].copy()
+        frame[columns[-1]] = self.scores[method][positions]
+        return frame
+
+    def top(self, method, n=3):
+        return self.frame(method, [pos for _, pos in self.rankings[method].islice(0, n)])
+
+    def results(self):
+        # The session as a {method: (df or None, errors)} dict, the shape
+        # risk_scoring.score_methods returns, in current ranking order.
+        results = {}
+        for method in self.methods:
+            ranking = self.rankings[method]
+            errors = [self.errors[method][pos] for pos in sorted(self.errors[method])]
+            results[method] = (self.frame(method, [pos for _, pos in ranking]) if ranking else None, errors)
+        return results